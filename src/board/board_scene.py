@@ -1,7 +1,7 @@
 import itertools
 import multiprocessing
 from concurrent.futures import ProcessPoolExecutor
-from typing import Any, Tuple, Optional, Union
+from typing import Any, Tuple, Optional
 
 from PySide2.QtCore import (QSize, Qt, QRect, Signal)
 from PySide2.QtGui import (QIcon)
@@ -12,6 +12,8 @@ from PySide2.QtWidgets import (
 from board.tile_item import Tile
 from board.piece_item import Piece
 from logic.chess_logic import ChessLogic
+from logic.moves import moveToCoords
+from net.protocol import encodeMove
 from bot.chess_bot import ChessBot
 from typing import TYPE_CHECKING, Any
 
@@ -22,7 +24,7 @@ else:
 
 
 class Board(QGraphicsScene):
-    botMoveReady = Signal(tuple)
+    botMoveReady = Signal(int)
 
     def __init__(self, parent: MainWindow) -> None:
         super().__init__(parent)
@@ -178,26 +180,25 @@ class Board(QGraphicsScene):
         # TCP/IP support
         if self.mainWindow.mode == "2 players":
             # Send last performed move
-            self.mainWindow.client.sendData(self.logic.lastMove)
-
-            # Change active online player
-            # Send end of turn time to "synchronize" timers
-            if self.mainWindow.netActivePlayer == "light":
-                time = self.mainWindow.clock1.leftTime
-                leftTime = (
-                    f"{time.hour()}:{time.minute()}"
-                    f":{time.second()}:{time.msec()}"
-                )
-                self.mainWindow.client.sendData(f"time:{leftTime}")
-                self.mainWindow.netActivePlayer = "dark"
-            elif self.mainWindow.netActivePlayer == "dark":
-                time = self.mainWindow.clock2.leftTime
-                leftTime = (
-                    f"{time.hour()}:{time.minute()}"
-                    f":{time.second()}:{time.msec()}"
-                )
-                self.mainWindow.client.sendData(f"time:{leftTime}")
-                self.mainWindow.netActivePlayer = "light"
+            self.mainWindow.client.sendData(encodeMove(self.logic.lastMove))
+
+            # Change active online player (clocks are sent by the server)
+            self.mainWindow.netActivePlayer = "dark" \
+                if self.mainWindow.netActivePlayer == "light" else "light"
+
+    def resetPosition(self) -> None:
+        # Back to the initial position with the same styles (network mode,
+        # the moves accepted by the server are replayed after it)
+        styles = self.getStyleConfig()
+        for item in self.items():
+            if isinstance(item, Piece):
+                self.removeItem(item)
+
+        self.logic = ChessLogic()
+        self.createPieces()
+        self.applyStyleConfig(*styles)
+        self.logic.activePlayer = "light"
+        self.historyBlockTableWidget.setRowCount(0)
 
     def changeClocks(self, player: str) -> None:
         if player == "light":
@@ -234,13 +235,15 @@ class Board(QGraphicsScene):
         # Refresh history
         self.refreshHistoryBlock()
 
-        # Check the checkmate
-        isCheckmate = self.logic.isCheckmate(
-            self.logic.activePlayer == "light")
-        if isCheckmate:
+        # Check the end of the game (checkmate or draw)
+        gameStatus = self.logic.gameStatus()
+        if gameStatus == "checkmate":
             self.logic.activePlayer = previousPlayer
             self.gameOver()
             return
+        if gameStatus is not None:
+            self.gameOver(gameStatus)
+            return
 
         if not self.mainWindow.isPlayback:
             self.changeClocks(player)   # Set game clocks
@@ -352,7 +355,7 @@ class Board(QGraphicsScene):
         # Clear input field
         self.playerInputLineEdit.clear()
 
-    def gameOver(self) -> None:
+    def gameOver(self, drawReason: Optional[str] = None) -> None:
         # Stop the game and show game over message
         self.clock1.timer.stop()
         self.clock2.timer.stop()
@@ -362,7 +365,7 @@ class Board(QGraphicsScene):
 
         self.playerInputLineEdit.setPlaceholderText("Game over!")
 
-        self.showGameOverMessage()
+        self.showGameOverMessage(drawReason)
         self.logic.activePlayer = None
 
     # -----------
@@ -370,15 +373,15 @@ class Board(QGraphicsScene):
     # -----------
 
     def startBot(self) -> None:
-        self.chessBot = ChessBot()
+        self.chessBot = ChessBot(cachePath="cache/eval_cache.db")
 
     def botMove(self, future: Any = None) -> None:
         move = future.result()
-        self.botMoveReady.emit(move)
+        if move is not None:
+            self.botMoveReady.emit(move)
 
-    def makeBotMove(self, move: Tuple[Union[int, str], ...]) -> None:
-        startX, startY, newX, newY = map(int, move[:4])
-        promotionPiece = move[4] if len(move) > 4 else None
+    def makeBotMove(self, move: int) -> None:
+        startX, startY, newX, newY, promotionPiece = moveToCoords(move)
         sanMove = self.logic.coordsToSAN(startX, startY, newX, newY,
                                          promotionPiece)
         self.textMove(sanMove)
@@ -393,11 +396,12 @@ class Board(QGraphicsScene):
     # Additional windows
     # ------------------
 
-    def showGameOverMessage(self) -> None:
+    def showGameOverMessage(self, drawReason: Optional[str] = None) -> None:
         msg = QMessageBox(self.views()[0])
         msg.setWindowIcon(QIcon(QApplication.instance().style().standardPixmap(
             QStyle.SP_FileDialogInfoView)))
         msg.setIcon(QMessageBox.Information)
-        msg.setText(f"Winner: {self.logic.activePlayer} side!")
+        msg.setText(f"Draw: {drawReason}!" if drawReason
+                    else f"Winner: {self.logic.activePlayer} side!")
         msg.setWindowTitle("Game over")
         msg.show()
@@ -1,107 +1,394 @@
-import copy
+import os
 import numpy as np
-from typing import List, Tuple, Optional, Union
+from array import array
+from typing import Dict, Iterator, List, Sequence, Tuple, Optional
 
+from logic.attack_map import PAWN, KING, PIECE_CODES
 from logic.chess_logic import ChessLogic
+from logic.moves import (
+    EN_PASSANT, moveStart, moveEnd, moveFlags, isPromotionMove,
+    isTacticalMove, movePromotionPiece)
+from logic.symmetry import (
+    COLOUR_FLIP, IDENTITY, INVERSE_TRANSFORMS, transformMove)
+from bot.eval_cache import (
+    EvalCache, CacheEntry, EXACT, LOWER_BOUND, UPPER_BOUND)
+from bot.neural_eval import NeuralEvaluator
+from bot.pawn_cache import PawnCache
+
+# Material values indexed by piece code + 6 (dark pieces count negatively)
+PIECE_VALUES: np.ndarray = np.array(
+    [0, -900, -500, -330, -320, -100, 0, 100, 320, 330, 500, 900, 0])
+PIECE_TYPE_VALUES: List[int] = [0, 100, 320, 330, 500, 900, 0]
+
+# Pawn structure terms: penalties for every extra pawn on a file and for a
+# pawn without own pawns on the neighbouring files, bonuses for a passed
+# pawn by the number of steps it has made
+DOUBLED_PAWN_PENALTY: int = 15
+ISOLATED_PAWN_PENALTY: int = 12
+PASSED_PAWN_BONUSES: List[int] = [0, 10, 20, 35, 60, 100]
+
+# Number of killer moves remembered for each ply
+KILLER_MOVES: int = 2
+
+# Score of a mate at the root; mates found later score less, so the bot
+# prefers the fastest mate and the slowest loss. Scores beyond the bound are
+# mates (kept relative to the node in the cache)
+MATE_SCORE: int = 100000
+MATE_BOUND: int = MATE_SCORE - 1000
 
 
 class ChessBot:
-    def __init__(self, depth: int = 3) -> None:
+    def __init__(self, depth: int = 3, cachePath: Optional[str] = None,
+                 networkPath: Optional[str] = None) -> None:
         self.depth: int = depth
 
-    def getBotMove(self, logic: ChessLogic) \
-            -> Optional[Tuple[Union[int, str], ...]]:
+        # Quiet moves which caused cutoffs, for each ply of the search
+        self.killers: List[List[int]] = [[] for _ in range(depth + 1)]
+
+        # Optional network evaluation instead of material and pawns
+        self.evaluator: Optional[NeuralEvaluator] = \
+            NeuralEvaluator(networkPath) if networkPath else None
+
+        # Network scores are kept in a separate database for each network
+        # and are not shared between symmetric positions (a network is not
+        # guaranteed to be colour and mirror symmetric)
+        if cachePath and self.evaluator is not None:
+            root, extension = os.path.splitext(cachePath)
+            cachePath = f"{root}.{self.evaluator.getWeightsId()}{extension}"
+        self.isSymmetric: bool = self.evaluator is None
+
+        # Optional persistent cache of searched positions and the cache of
+        # pawn structure scores
+        self.evalCache: Optional[EvalCache] = \
+            EvalCache(cachePath) if cachePath else None
+        self.pawnCache: PawnCache = PawnCache()
+
+    def getBotMove(self, logic: ChessLogic) -> Optional[int]:
+        self.killers = [[] for _ in range(self.depth + 1)]
+        if self.evaluator is not None:
+            self.evaluator.reset(logic.board)
+
         bestMove, _ = self.minimax(logic, self.depth,
                                    float('-inf'), float('inf'))
-        if bestMove is None:
-            return None
 
-        return tuple(bestMove)
+        # Write new results to disk before the worker process is dropped
+        if self.evalCache is not None:
+            self.evalCache.flush()
+
+        print("[Bot Log] Stats: " + " | ".join(
+            f"{name}: {value:.1%}" for name, value in self.getStats().items()))
+
+        return bestMove
+
+    def getStats(self) -> Dict[str, float]:
+        # Hit rates of the caches
+        stats = {'pawn cache': self.pawnCache.getHitRate()}
+        if self.evalCache is not None:
+            stats['eval cache'] = self.evalCache.getHitRate()
+
+        return stats
 
     def minimax(self, logic: ChessLogic, depth: int,
-                alpha: float, beta: float) \
-            -> Tuple[Optional[Union[List[Union[int, str]],
-                                    Tuple[Union[int, str], ...]]], float]:
+                alpha: float, beta: float) -> Tuple[Optional[int], float]:
         player = logic.activePlayer
-        if depth == 0 or logic.isCheckmate(player != 'light'):
-            return None, self.evaluateBoard(logic)
 
-        moves = self.getAllLegalMoves(logic)
-        bestMove = None
-        if player == 'light':
-            maxValue = float('-inf')
+        # Repeated positions and the fifty-move rule end in a draw
+        if depth < self.depth and (logic.getRepetitionCount() >= 2
+                                   or logic.isFiftyMoveRule()):
+            return None, 0
 
-            for move in moves:
-                newLogic = copy.deepcopy(logic)  # Simulate further playing
-                newLogic.movePiece(*move)
+        if depth == 0:
+            return None, self.evaluateBoard(logic)
 
-                if newLogic.isPromotion(move[2], move[3]):
-                    promotePiece = 'q'   # Queen is most valuable in promotion
-                    newLogic.promotePawn(move[2], move[3], promotePiece)
-                    move = move + (promotePiece,)
+        # Lack of mating material ends in a draw too
+        if logic.isInsufficientMaterial():
+            return None, 0
 
-                newLogic.switchActivePlayer()
+        # Check if the position (or a symmetric one) has already been
+        # searched deep enough
+        entry = None
+        if self.evalCache is not None:
+            positionHash, transform = logic.getCanonicalHash() \
+                if self.isSymmetric else (logic.getPositionHash(), IDENTITY)
+            entry = self.evalCache.get(positionHash)
+            if entry is not None:
+                entry = self.transformEntry(entry,
+                                            INVERSE_TRANSFORMS[transform],
+                                            self.depth - depth)
+            if entry is not None and entry[0] >= depth:
+                _, flag, score, move = entry
+                if flag == EXACT \
+                        or (flag == LOWER_BOUND and score >= beta) \
+                        or (flag == UPPER_BOUND and score <= alpha):
+                    return move, score
 
-                _, value = self.minimax(newLogic, depth - 1, alpha, beta)
-                if value > maxValue:
+        alphaStart, betaStart = alpha, beta
+        hashMove = entry[3] if entry is not None else None
+        ply = self.depth - depth
+        moveCount = 0
+        bestMove = None  # The first move tried until a better one is found
+        if depth == 1 and self.evaluator is not None:
+            bestMove, bestValue, moveCount = self.searchFrontier(
+                logic, hashMove, ply)
+        elif player == 'light':
+            maxValue = float('-inf')
+
+            for move in self.iterStagedMoves(logic, hashMove, ply):
+                moveCount += 1
+                self.makeMove(logic, move)  # Simulate further playing
+                _, value = self.minimax(logic, depth - 1, alpha, beta)
+                self.unmakeMove(logic)
+                if bestMove is None or value > maxValue:
                     maxValue = value
                     bestMove = move
 
                 alpha = max(alpha, value)
                 if beta <= alpha:
+                    self.storeKiller(move, ply)
                     break
 
-            return bestMove, maxValue
+            bestValue = maxValue
         else:
             minValue = float('inf')
 
-            for move in moves:
-                newLogic = copy.deepcopy(logic)  # Simulate further playing
-                newLogic.movePiece(*move)
-
-                if newLogic.isPromotion(move[2], move[3]):
-                    promotePiece = 'q'  # Queen is most valuable in promotion
-                    newLogic.promotePawn(move[2], move[3], promotePiece)
-                    move = move + (promotePiece,)
-
-                newLogic.switchActivePlayer()
-
-                _, value = self.minimax(newLogic, depth - 1, alpha, beta)
-                if value < minValue:
+            for move in self.iterStagedMoves(logic, hashMove, ply):
+                moveCount += 1
+                self.makeMove(logic, move)  # Simulate further playing
+                _, value = self.minimax(logic, depth - 1, alpha, beta)
+                self.unmakeMove(logic)
+                if bestMove is None or value < minValue:
                     minValue = value
                     bestMove = move
 
                 beta = min(beta, value)
                 if beta <= alpha:
+                    self.storeKiller(move, ply)
                     break
 
-            return bestMove, minValue
+            bestValue = minValue
+
+        # No legal moves: mate is the worst result for the mated, stalemate
+        # is a draw
+        if moveCount == 0:
+            bestValue = self.getMateScore(logic, ply)
+
+        # Remember the result (a cutoff gives only a bound on the score)
+        if self.evalCache is not None:
+            if bestValue <= alphaStart:
+                flag = UPPER_BOUND
+            elif bestValue >= betaStart:
+                flag = LOWER_BOUND
+            else:
+                flag = EXACT
+            self.evalCache.store(positionHash, *self.transformEntry(
+                (depth, flag, bestValue, bestMove), transform, -ply))
+
+        return bestMove, bestValue
+
+    def searchFrontier(self, logic: ChessLogic, hashMove: Optional[int],
+                       ply: int) -> Tuple[Optional[int], float, int]:
+        # Children of the node are leaves: their accumulators are collected
+        # and evaluated with one matrix multiplication
+        isLight = (logic.activePlayer == "light")
+        moves, accumulators, draws = [], [], []
+
+        for move in self.iterStagedMoves(logic, hashMove, ply):
+            moves.append(move)
+            accumulators.append(self.evaluator.getChildAccumulator(
+                logic.getMoveChanges(move)))
+
+            # Repetitions and the fifty-move rule are impossible right after
+            # a capture or a pawn move
+            isDraw = False
+            if logic.halfmoveClock >= 3 and not isTacticalMove(move) \
+                    and abs(logic.board[moveStart(move)]) != PAWN:
+                logic.makeMove(move)
+                isDraw = logic.getRepetitionCount() >= 2 \
+                    or logic.isFiftyMoveRule()
+                logic.unmakeMove()
+            draws.append(isDraw)
+
+        if not moves:
+            return None, self.getMateScore(logic, ply), 0
+
+        values = self.evaluator.evaluate(np.array(accumulators))
+        values[draws] = 0
+        ind = int(np.argmax(values) if isLight else np.argmin(values))
+
+        return moves[ind], float(values[ind]), len(moves)
 
     @staticmethod
-    def getAllLegalMoves(logic: ChessLogic) -> List[Tuple[int, int, int, int]]:
-        player = logic.activePlayer
-        pieces = np.where(np.char.isupper(logic.textBoard)) \
-            if player == 'light' \
-            else np.where(np.char.islower(logic.textBoard))
-        moves = [(y, x, move[0], move[1])
-                 for x, y in zip(*pieces)
-                 for move in logic.getLegalMoves(y, x)]
-        return moves
+    def getMateScore(logic: ChessLogic, ply: int) -> float:
+        # Score of a position without legal moves
+        isLight = (logic.activePlayer == "light")
+        if not logic.isInCheck(isLight)[2]:
+            return 0
+
+        return -(MATE_SCORE - ply) if isLight else MATE_SCORE - ply
+
+    def makeMove(self, logic: ChessLogic, move: int) -> None:
+        # Network accumulator follows the position
+        if self.evaluator is not None:
+            self.evaluator.push(logic.getMoveChanges(move))
+        logic.makeMove(move)
+
+    def unmakeMove(self, logic: ChessLogic) -> None:
+        if self.evaluator is not None:
+            self.evaluator.pop()
+        logic.unmakeMove()
+
+    # ---------------
+    # Move generation
+    # ---------------
+
+    def iterStagedMoves(self, logic: ChessLogic, hashMove: Optional[int],
+                        ply: int) -> Iterator[int]:
+        # Legal moves in the order of their expected strength. Every stage is
+        # generated (and its moves checked for legality) only if the search
+        # has not been cut off before
+        isLight = (logic.activePlayer == "light")
+        squares = logic.getSquares()
+        kingSq = squares.index(KING if isLight else -KING)
+        triedMoves = []
+
+        # Best move of the previous search of the position
+        if hashMove is not None \
+                and logic.isPseudoLegalMove(squares, hashMove, isLight) \
+                and logic.isMoveLegal(squares, hashMove, kingSq):
+            triedMoves.append(hashMove)
+            yield hashMove
+
+        # Captures of the most valuable pieces by the least valuable ones;
+        # losing captures of defended pieces are left for the end
+        captures = sorted(logic.iterCaptureMoves(squares, isLight),
+                          key=lambda move: self.captureOrder(squares, move),
+                          reverse=True)
+        losingCaptures = []
+        for move in captures:
+            if move in triedMoves:
+                continue
+
+            if self.isLosingCapture(squares, move, isLight):
+                losingCaptures.append(move)
+            elif logic.isMoveLegal(squares, move, kingSq):
+                yield move
+
+        # Quiet moves which caused cutoffs at the same depth
+        for move in self.killers[ply]:
+            if move not in triedMoves \
+                    and logic.isPseudoLegalMove(squares, move, isLight) \
+                    and logic.isMoveLegal(squares, move, kingSq):
+                triedMoves.append(move)
+                yield move
+
+        for move in logic.iterPseudoMoves(squares, isLight):
+            if not isTacticalMove(move) and move not in triedMoves \
+                    and logic.isMoveLegal(squares, move, kingSq):
+                yield move
+
+        for move in losingCaptures:
+            if logic.isMoveLegal(squares, move, kingSq):
+                yield move
+
+    @staticmethod
+    def captureOrder(squares: array, move: int) -> Tuple[int, int]:
+        # Most valuable victim first, then least valuable attacker
+        victim = PIECE_TYPE_VALUES[abs(squares[moveEnd(move)])]
+        if isPromotionMove(move):
+            victim += PIECE_TYPE_VALUES[
+                PIECE_CODES[movePromotionPiece(move).upper()]]
+
+        return victim, -PIECE_TYPE_VALUES[abs(squares[moveStart(move)])]
+
+    @staticmethod
+    def isLosingCapture(squares: array, move: int, isLight: bool) -> bool:
+        # Piece is worth more than the captured one and can be taken back
+        if isPromotionMove(move) or moveFlags(move) == EN_PASSANT:
+            return False
+
+        endSq = moveEnd(move)
+        return PIECE_TYPE_VALUES[abs(squares[moveStart(move)])] \
+            > PIECE_TYPE_VALUES[abs(squares[endSq])] \
+            and ChessLogic.isSquareAttackedOn(squares, endSq, not isLight)
+
+    def storeKiller(self, move: int, ply: int) -> None:
+        # Only quiet moves are remembered (captures are tried early anyway)
+        if isTacticalMove(move) or move in self.killers[ply]:
+            return
+
+        self.killers[ply].insert(0, move)
+        del self.killers[ply][KILLER_MOVES:]
+
+    # -------------
+    # Cache support
+    # -------------
+
+    @staticmethod
+    def transformEntry(entry: CacheEntry, transform: int,
+                       plyShift: int = 0) -> CacheEntry:
+        # Colour flip changes the sign of the score (and so swaps bounds).
+        # Mate scores are stored relative to the node and shifted by its
+        # ply when read
+        depth, flag, score, move = entry
+        if move is not None:
+            move = transformMove(move, transform)
+
+        if score > MATE_BOUND:
+            score -= plyShift
+        elif score < -MATE_BOUND:
+            score += plyShift
+
+        if transform & COLOUR_FLIP:
+            score = -score
+            flag = UPPER_BOUND if flag == LOWER_BOUND \
+                else LOWER_BOUND if flag == UPPER_BOUND else flag
+
+        return depth, flag, score, move
+
+    # ----------
+    # Evaluation
+    # ----------
+
+    def evaluateBoard(self, logic: ChessLogic) -> float:
+        if self.evaluator is not None:
+            return self.evaluator.evaluateCurrent()
+
+        codes = logic.getCodeBoard().astype(np.intp)
+        value = int(PIECE_VALUES[codes + KING].sum())
+
+        # Pawn structure is the same in most of the leaves
+        pawnValue = self.pawnCache.get(logic.pawnHash)
+        if pawnValue is None:
+            pawnValue = self.evaluatePawnStructure(logic.board)
+            self.pawnCache.store(logic.pawnHash, pawnValue)
+
+        return value + pawnValue
 
     @staticmethod
-    def evaluateBoard(logic: ChessLogic) -> int:
-        pieceValues = {
-            'P': 100, 'p': -100,
-            'N': 320, 'n': -320,
-            'B': 330, 'b': -330,
-            'R': 500, 'r': -500,
-            'Q': 900, 'q': -900,
-            'K': 0, 'k': 0
-        }
-        board = logic.textBoard
-        unique, counts = np.unique(board, return_counts=True)
-        pieceCounts = dict(zip(unique, counts))
-        value = sum(pieceValues.get(piece, 0) * count
-                    for piece, count in pieceCounts.items())
+    def evaluatePawnStructure(board: Sequence[int]) -> int:
+        lightPawns = [sq for sq, code in enumerate(board) if code == PAWN]
+        darkPawns = [sq for sq, code in enumerate(board) if code == -PAWN]
+        value = 0
+
+        for pawns, enemyPawns, sign in ((lightPawns, darkPawns, 1),
+                                        (darkPawns, lightPawns, -1)):
+            fileCounts = [0] * 10   # Files shifted by one, with empty edges
+            for sq in pawns:
+                fileCounts[sq % 8 + 1] += 1
+
+            value -= sign * DOUBLED_PAWN_PENALTY * sum(
+                count - 1 for count in fileCounts if count > 1)
+
+            for sq in pawns:
+                x, y = sq % 8, sq // 8
+                if not fileCounts[x] and not fileCounts[x + 2]:
+                    value -= sign * ISOLATED_PAWN_PENALTY
+
+                # No enemy pawns ahead on the same and neighbouring files
+                if not any(abs(enemySq % 8 - x) <= 1
+                           and (enemySq // 8 - y) * sign < 0
+                           for enemySq in enemyPawns):
+                    value += sign * PASSED_PAWN_BONUSES[
+                        6 - y if sign > 0 else y - 1]
 
         return value
@@ -0,0 +1,180 @@
+import os
+import queue
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# Kinds of stored scores (alpha-beta search returns bounds on cutoffs)
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+
+# Version of the table layout (older databases are cleared)
+SCHEMA_VERSION: int = 6
+
+# Only results of deeper searches are written to disk, the table is capped
+# (the shallowest results are evicted first)
+MIN_STORED_DEPTH: int = 2
+MAX_ROWS: int = 200000
+
+CacheEntry = Tuple[int, int, float, Optional[int]]  # depth, flag, score, move
+
+
+class EvalCache:
+    def __init__(self, path: str, batchSize: int = 256,
+                 maxRows: int = MAX_ROWS) -> None:
+        self.path: str = path
+        self.batchSize: int = batchSize
+        self.maxRows: int = maxRows
+
+        # Entries read from the database or stored by this process (None for
+        # positions missing in the database). The database is probed per
+        # position, the bot is pickled into a new worker process for every
+        # move and never reads the whole table
+        self.entries: Dict[int, Optional[CacheEntry]] = {}
+        self.reader: Optional[sqlite3.Connection] = None
+        self.pending: List[Tuple[int, int, int, float, Optional[int]]] = []
+
+        # Background writer
+        self.writeQueue: Optional[queue.Queue] = None
+        self.writerThread: Optional[threading.Thread] = None
+
+        # Statistics
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Only the configuration travels to worker processes
+        return {'path': self.path, 'batchSize': self.batchSize,
+                'maxRows': self.maxRows}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state['path'], state['batchSize'], state['maxRows'])
+
+    # ----------------
+    # Database support
+    # ----------------
+
+    @staticmethod
+    def connect(path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+
+        if conn.execute('PRAGMA user_version').fetchone()[0] \
+                != SCHEMA_VERSION:
+            conn.execute('DROP TABLE IF EXISTS evaluations')
+            conn.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+
+        conn.execute('''
+                CREATE TABLE IF NOT EXISTS evaluations (
+                    hash INTEGER PRIMARY KEY,
+                    depth INTEGER,
+                    flag INTEGER,
+                    score REAL,
+                    move INTEGER
+                )
+            ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS evaluations_depth '
+                     'ON evaluations (depth)')
+
+        return conn
+
+    def load(self) -> None:
+        if self.reader is not None:
+            return
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.reader = self.connect(self.path)
+
+        # Start background writer
+        self.writeQueue = queue.Queue()
+        self.writerThread = threading.Thread(target=self.writeBatches,
+                                             daemon=True)
+        self.writerThread.start()
+
+    def writeBatches(self) -> None:
+        conn = self.connect(self.path)
+
+        while True:
+            batch = self.writeQueue.get()
+            if batch:
+                # Keep the deeper result when the position is already stored
+                with conn:
+                    conn.executemany('''
+                        INSERT INTO evaluations
+                            (hash, depth, flag, score, move)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT(hash) DO UPDATE SET
+                            depth = excluded.depth, flag = excluded.flag,
+                            score = excluded.score, move = excluded.move
+                        WHERE excluded.depth >= evaluations.depth
+                    ''', batch)
+                    self.evict(conn)
+            self.writeQueue.task_done()
+
+    def evict(self, conn: sqlite3.Connection) -> None:
+        # Shallowest results go first when the table is over the limit
+        excess = conn.execute('SELECT COUNT(*) FROM evaluations') \
+            .fetchone()[0] - self.maxRows
+        if excess > 0:
+            conn.execute('''
+                DELETE FROM evaluations WHERE hash IN (
+                    SELECT hash FROM evaluations ORDER BY depth LIMIT ?)
+            ''', (excess,))
+
+    def flush(self, wait: bool = True) -> None:
+        if self.writeQueue is None:
+            return
+
+        if self.pending:
+            self.writeQueue.put(self.pending)
+            self.pending = []
+
+        if wait:
+            self.writeQueue.join()
+
+    # ------------
+    # Cache access
+    # ------------
+
+    def get(self, positionHash: int) -> Optional[CacheEntry]:
+        self.load()
+        if positionHash in self.entries:
+            entry = self.entries[positionHash]
+        else:
+            entry = self.reader.execute(
+                'SELECT depth, flag, score, move FROM evaluations '
+                'WHERE hash = ?', (positionHash,)).fetchone()
+            self.entries[positionHash] = entry
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return entry
+
+    def store(self, positionHash: int, depth: int, flag: int, score: float,
+              move: Optional[int]) -> None:
+        self.load()
+
+        # Never replace a deeper search with a shallower one
+        entry = self.entries.get(positionHash)
+        if entry is not None and entry[0] > depth:
+            return
+
+        self.entries[positionHash] = (depth, flag, score, move)
+        if depth < MIN_STORED_DEPTH:
+            return
+
+        self.pending.append((positionHash, depth, flag, score, move))
+
+        if len(self.pending) >= self.batchSize:
+            self.flush(wait=False)
+
+    def getHitRate(self) -> float:
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,101 @@
+import hashlib
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from logic.attack_map import EMPTY, KING
+
+# Input features: one per piece type of each side on each square. Offsets of
+# the features are indexed by piece code + 6 (light pieces go first)
+FEATURES_COUNT: int = 768
+FEATURE_OFFSETS: List[int] = [
+    64 * (code - 1 if code > EMPTY else 5 - code) if code != EMPTY else 0
+    for code in range(-KING, KING + 1)
+]
+
+PieceChanges = Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]
+
+
+class NeuralEvaluator:
+    # Two-layer network scoring positions in centipawns for the light side.
+    # The .npz file holds 'inputWeights' (768 x N), 'inputBias' (N),
+    # 'outputWeights' (N) and 'outputBias' (scalar)
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+
+        # Weights, loaded lazily (the bot is pickled before searching)
+        self.inputWeights: Optional[np.ndarray] = None
+        self.inputBias: Optional[np.ndarray] = None
+        self.outputWeights: Optional[np.ndarray] = None
+        self.outputBias: float = 0.0
+
+        # First layer sums of the current line of the search
+        self.accumulators: List[np.ndarray] = []
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {'path': self.path}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state['path'])
+
+    def getWeightsId(self) -> str:
+        # Digest of the weights file (scores of different networks must not
+        # be mixed in persistent caches)
+        with open(self.path, 'rb') as file:
+            return hashlib.sha1(file.read()).hexdigest()[:16]
+
+    def load(self) -> None:
+        if self.inputWeights is not None:
+            return
+
+        with np.load(self.path) as weights:
+            self.inputWeights = weights['inputWeights'].astype(np.float32)
+            self.inputBias = weights['inputBias'].astype(np.float32)
+            self.outputWeights = \
+                weights['outputWeights'].astype(np.float32).reshape(-1)
+            self.outputBias = float(weights['outputBias'])
+
+        if self.inputWeights.shape[0] != FEATURES_COUNT:
+            raise ValueError(f"Incorrect network in {self.path}")
+
+    # -----------
+    # Accumulator
+    # -----------
+
+    @staticmethod
+    def getFeatures(pieces: Sequence[Tuple[int, int]]) -> List[int]:
+        return [FEATURE_OFFSETS[code + KING] + sq for code, sq in pieces]
+
+    def reset(self, board: Sequence[int]) -> None:
+        # Full computation for the root position
+        self.load()
+        features = self.getFeatures([(code, sq)
+                                     for sq, code in enumerate(board)
+                                     if code != EMPTY])
+        self.accumulators = [
+            self.inputBias + self.inputWeights[features].sum(axis=0)]
+
+    def getChildAccumulator(self, changes: PieceChanges) -> np.ndarray:
+        # Only the rows of the changed pieces are added and subtracted
+        removed, added = changes
+
+        return self.accumulators[-1] \
+            + self.inputWeights[self.getFeatures(added)].sum(axis=0) \
+            - self.inputWeights[self.getFeatures(removed)].sum(axis=0)
+
+    def push(self, changes: PieceChanges) -> None:
+        self.accumulators.append(self.getChildAccumulator(changes))
+
+    def pop(self) -> None:
+        self.accumulators.pop()
+
+    # ----------
+    # Evaluation
+    # ----------
+
+    def evaluate(self, accumulators: np.ndarray) -> np.ndarray:
+        # (K, N) first layer sums -> K scores with one matrix multiplication
+        return np.maximum(accumulators, 0) @ self.outputWeights \
+            + self.outputBias
+
+    def evaluateCurrent(self) -> float:
+        return float(self.evaluate(self.accumulators[-1][np.newaxis])[0])
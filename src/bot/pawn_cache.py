@@ -0,0 +1,49 @@
+from typing import Any, Dict, List, Optional
+
+# Number of cache slots (power of two, slot is taken from the low bits of
+# the pawn hash)
+PAWN_CACHE_SIZE: int = 1 << 14
+
+
+class PawnCache:
+    def __init__(self, size: int = PAWN_CACHE_SIZE) -> None:
+        self.size: int = size
+        self.mask: int = size - 1
+
+        # Direct-mapped slots: a newer pawn structure replaces an older one
+        # (allocated on first use, the bot is pickled before searching)
+        self.keys: Optional[List[int]] = None
+        self.scores: Optional[List[int]] = None
+
+        # Statistics
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {'size': self.size}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state['size'])
+
+    def get(self, pawnHash: int) -> Optional[int]:
+        if self.keys is None:
+            self.keys = [-1] * self.size
+            self.scores = [0] * self.size
+
+        slot = pawnHash & self.mask
+        if self.keys[slot] != pawnHash:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return self.scores[slot]
+
+    def store(self, pawnHash: int, score: int) -> None:
+        slot = pawnHash & self.mask
+        self.keys[slot] = pawnHash
+        self.scores[slot] = score
+
+    def getHitRate(self) -> float:
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.0
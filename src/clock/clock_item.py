@@ -57,15 +57,34 @@ class Clock(QGraphicsEllipseItem):
                       + 60 * currentTime.minute()
                       + 60 * 60 * currentTime.hour()))
 
-        # If timer ends - game is over
+        # If timer ends - game is over (the server decides in network mode)
         if self.leftTime <= QTime(0, 0, 0, 0):
             self.timer.stop()
+            if self.mainWindow.mode == "2 players":
+                self.update()
+                return
             self.mainWindow.board.changeActivePlayer(
                 self.mainWindow.board.logic.activePlayer)
             self.mainWindow.board.gameOver()
 
         self.update()
 
+    def setLeftTime(self, timeLeft: int) -> None:
+        # Time left sent by the server (ms)
+        time = QTime.fromMSecsSinceStartOfDay(timeLeft)
+
+        if self.timer.isActive():
+            self.endTime = QTime.currentTime().addMSecs(timeLeft)
+        elif self.leftTime == QTime(0, 0, 0, 0):
+            # Timer is not started yet
+            self.gameTime = time
+            return
+        else:
+            self.endTime = self.beforePause.addMSecs(timeLeft)
+
+        self.leftTime = time
+        self.update()
+
     def pauseTimer(self) -> None:
         self.timer.stop()
         self.beforePause = QTime.currentTime()
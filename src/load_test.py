@@ -0,0 +1,75 @@
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import resource
+import subprocess
+
+from net.load_test import LoadTest, parseThinkTime, loadScripts
+
+
+def startServer(ip: str, port: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "server.py", "--ip", ip, "--port", str(port)],
+        cwd=sys.path[0], stdout=subprocess.DEVNULL)
+
+    # Wait until the server accepts connections
+    for _ in range(100):
+        try:
+            socket.create_connection((ip, port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+
+    server.kill()
+    sys.exit(f"Server at {ip}:{port} does not start")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load test of the chess server with simulated clients")
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=60,
+                        help="seconds")
+    parser.add_argument("--ramp-up", type=float, default=5,
+                        help="seconds to connect all clients")
+    parser.add_argument("--think", default="exp:1",
+                        help="const:S, uniform:A:B, exp:MEAN or "
+                             "lognormal:MU:SIGMA (seconds)")
+    parser.add_argument("--time-control", type=int, nargs=2,
+                        default=(300, 0), metavar=("BASE", "INCREMENT"),
+                        help="seconds")
+    parser.add_argument("--rating-spread", type=int, default=300)
+    parser.add_argument("--script", help="file with a game in SAN per line")
+    parser.add_argument("--max-plies", type=int, default=0)
+    parser.add_argument("--interval", type=float, default=1,
+                        help="seconds between reports")
+    parser.add_argument("--server-pid", type=int,
+                        help="process to monitor (default: started server)")
+    parser.add_argument("--spawn-server", action="store_true")
+    args = parser.parse_args()
+
+    # Every client needs a socket (and the started server one more)
+    _, hardLimit = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hardLimit, hardLimit))
+
+    server = startServer(args.ip, args.port) if args.spawn_server else None
+    loadTest = LoadTest(
+        args.ip, args.port, args.clients, args.duration,
+        parseThinkTime(args.think),
+        (1000 * args.time_control[0], 1000 * args.time_control[1]),
+        args.rating_spread, args.ramp_up,
+        loadScripts(args.script) if args.script else None, args.max_plies,
+        args.interval,
+        server.pid if server is not None else args.server_pid)
+    try:
+        asyncio.run(loadTest.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,77 @@
+import numpy as np
+from typing import Dict, List, Tuple
+
+# Compact piece codes (light pieces are positive, dark pieces negative)
+EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(7)
+PIECE_CODES: Dict[str, int] = {
+    '.': EMPTY,
+    'P': PAWN, 'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING,
+    'p': -PAWN, 'n': -KNIGHT, 'b': -BISHOP, 'r': -ROOK, 'q': -QUEEN,
+    'k': -KING
+}
+PIECE_NAMES: Dict[int, str] = {code: name
+                               for name, code in PIECE_CODES.items()}
+
+# Shifts (dy, dx) on the board with rows from the 8th rank to the 1st
+KNIGHT_SHIFTS: List[Tuple[int, int]] = [(2, 1), (1, 2), (-1, 2), (-2, 1),
+                                        (-2, -1), (-1, -2), (1, -2), (2, -1)]
+ROOK_SHIFTS: List[Tuple[int, int]] = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_SHIFTS: List[Tuple[int, int]] = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+KING_SHIFTS: List[Tuple[int, int]] = ROOK_SHIFTS + BISHOP_SHIFTS
+
+
+def shiftMasks(masks: np.ndarray, dy: int, dx: int) -> np.ndarray:
+    # Move all squares of (..., 8, 8) masks by (dy, dx), dropping what
+    # leaves the board
+    shifted = np.zeros_like(masks)
+    shifted[..., max(dy, 0):8 + min(dy, 0), max(dx, 0):8 + min(dx, 0)] = \
+        masks[..., max(-dy, 0):8 + min(-dy, 0), max(-dx, 0):8 + min(-dx, 0)]
+
+    return shifted
+
+
+def slidingAttacks(sliders: np.ndarray, empty: np.ndarray,
+                   shifts: List[Tuple[int, int]]) -> np.ndarray:
+    # Shift-and-mask fill: rays stop at the first occupied square (which is
+    # still attacked)
+    attacks = np.zeros_like(sliders)
+
+    for dy, dx in shifts:
+        ray = shiftMasks(sliders, dy, dx)
+        while ray.any():
+            attacks |= ray
+            ray = shiftMasks(ray & empty, dy, dx)
+
+    return attacks
+
+
+def computeAttackMaps(boards: np.ndarray) -> np.ndarray:
+    # Input: (..., 8, 8) boards with piece codes.
+    # Output: (..., 2, 8, 8) masks of squares attacked by light (index 0)
+    # and dark (index 1) pieces
+    boards = np.asarray(boards, dtype=np.int8)
+    sides = np.stack([boards, -boards], axis=-3)    # Own pieces are positive
+    empty = (boards == EMPTY)[..., np.newaxis, :, :]
+
+    # Pawns attack diagonally forward (light pawns move up the board)
+    pawns = (sides == PAWN)
+    attacks = np.zeros_like(pawns)
+    for side, dy in ((0, -1), (1, 1)):
+        attacks[..., side, :, :] = \
+            shiftMasks(pawns[..., side, :, :], dy, -1) \
+            | shiftMasks(pawns[..., side, :, :], dy, 1)
+
+    knights = (sides == KNIGHT)
+    for dy, dx in KNIGHT_SHIFTS:
+        attacks |= shiftMasks(knights, dy, dx)
+
+    kings = (sides == KING)
+    for dy, dx in KING_SHIFTS:
+        attacks |= shiftMasks(kings, dy, dx)
+
+    queens = (sides == QUEEN)
+    attacks |= slidingAttacks((sides == ROOK) | queens, empty, ROOK_SHIFTS)
+    attacks |= slidingAttacks((sides == BISHOP) | queens, empty,
+                              BISHOP_SHIFTS)
+
+    return attacks
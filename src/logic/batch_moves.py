@@ -0,0 +1,183 @@
+import numpy as np
+from typing import Optional
+
+from logic.attack_map import (
+    EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, KNIGHT_SHIFTS,
+    ROOK_SHIFTS, BISHOP_SHIFTS, KING_SHIFTS, shiftMasks, slidingAttacks,
+    computeAttackMaps)
+from logic.moves import CASTLE_LIGHT_KING, CASTLE_LIGHT_QUEEN
+
+# Number of positions (and of resulting positions during the legality test)
+# processed at once, to keep temporary arrays small
+POSITIONS_CHUNK: int = 256
+MOVES_CHUNK: int = 8192
+
+# Square indexes are 8 * y + x (a8 = 0, h1 = 63). Mirroring the ranks maps
+# a square to sq ^ 56
+SQUARES: np.ndarray = np.arange(64)
+FLIPPED_SQUARES: np.ndarray = SQUARES ^ 56
+
+# One square masks and jump targets of knights and kings for each square
+SINGLE_SQUARES: np.ndarray = np.eye(64, dtype=bool).reshape(64, 8, 8)
+KNIGHT_TARGETS: np.ndarray = np.any(
+    [shiftMasks(SINGLE_SQUARES, dy, dx) for dy, dx in KNIGHT_SHIFTS],
+    axis=0).reshape(64, 64)
+KING_TARGETS: np.ndarray = np.any(
+    [shiftMasks(SINGLE_SQUARES, dy, dx) for dy, dx in KING_SHIFTS],
+    axis=0).reshape(64, 64)
+
+
+def normalizePositions(positions: np.ndarray, lightToMove: np.ndarray,
+                       castling: np.ndarray, enPassant: np.ndarray):
+    # Mirror positions with dark to move, so the side to move is always
+    # light (positive codes) and its pawns move up the board
+    positions = positions.copy()
+    castling = castling.copy()
+    enPassant = enPassant.copy()
+
+    dark = ~lightToMove
+    positions[dark] = -positions[dark][:, FLIPPED_SQUARES]
+    castling[dark] = ((castling[dark] >> 2) & 3) | ((castling[dark] & 3) << 2)
+    enPassant[dark & (enPassant >= 0)] ^= 56
+
+    return positions, castling, enPassant
+
+
+def pseudoLegalMasks(positions: np.ndarray, castling: np.ndarray,
+                     enPassant: np.ndarray) -> np.ndarray:
+    # (N, 64) normalized positions -> (N, 64, 64) masks [position, from, to]
+    count = len(positions)
+    own = positions > EMPTY
+    enemy = positions < EMPTY
+    empty = positions == EMPTY
+    masks = np.zeros((count, 64, 64), dtype=bool)
+
+    # Knights and kings
+    masks |= (positions == KNIGHT)[:, :, np.newaxis] & KNIGHT_TARGETS
+    masks |= (positions == KING)[:, :, np.newaxis] & KING_TARGETS
+
+    # Sliders: every piece is filled separately on its own plane
+    planes = SINGLE_SQUARES.reshape(1, 64, 8, 8)
+    emptyBoards = empty.reshape(count, 1, 8, 8)
+    for pieces, shifts in (((positions == ROOK) | (positions == QUEEN),
+                            ROOK_SHIFTS),
+                           ((positions == BISHOP) | (positions == QUEEN),
+                            BISHOP_SHIFTS)):
+        sliders = planes & pieces.reshape(count, 64, 1, 1)
+        masks |= slidingAttacks(sliders, emptyBoards,
+                                shifts).reshape(count, 64, 64)
+
+    # Pieces can't capture own pieces
+    masks &= ~own[:, np.newaxis, :]
+
+    # Pawns: pushes, double pushes and captures
+    pawns = positions == PAWN
+    fromSq = SQUARES[8:]
+    masks[:, fromSq, fromSq - 8] |= pawns[:, fromSq] & empty[:, fromSq - 8]
+    fromSq = SQUARES[48:56]
+    masks[:, fromSq, fromSq - 16] |= pawns[:, fromSq] & empty[:, fromSq - 8] \
+        & empty[:, fromSq - 16]
+    for dx in (-1, 1):
+        fromSq = SQUARES[8:][(SQUARES[8:] % 8 + dx >= 0)
+                             & (SQUARES[8:] % 8 + dx < 8)]
+        masks[:, fromSq, fromSq - 8 + dx] |= pawns[:, fromSq] \
+            & enemy[:, fromSq - 8 + dx]
+
+    # En passant (the captured pawn square is given)
+    for dx in (-1, 1):
+        ind = np.nonzero((enPassant >= 0) & (enPassant % 8 + dx >= 0)
+                         & (enPassant % 8 + dx < 8))[0]
+        fromSq = enPassant[ind] + dx
+        masks[ind, fromSq, enPassant[ind] - 8] |= pawns[ind, fromSq]
+
+    # Castling: the king does not leave, cross or enter an attacked square
+    attacked = computeAttackMaps(
+        positions.reshape(count, 8, 8))[:, 1].reshape(count, 64)
+    kingHome = positions[:, 60] == KING
+    masks[:, 60, 62] |= kingHome & ((castling & CASTLE_LIGHT_KING) > 0) \
+        & (positions[:, 63] == ROOK) & empty[:, 61] & empty[:, 62] \
+        & ~attacked[:, 60] & ~attacked[:, 61] & ~attacked[:, 62]
+    masks[:, 60, 58] |= kingHome & ((castling & CASTLE_LIGHT_QUEEN) > 0) \
+        & (positions[:, 56] == ROOK) & empty[:, 57] & empty[:, 58] \
+        & empty[:, 59] & ~attacked[:, 60] & ~attacked[:, 59] \
+        & ~attacked[:, 58]
+
+    return masks
+
+
+def filterLegalMoves(positions: np.ndarray, masks: np.ndarray) -> None:
+    # Make every pseudo-legal move on a copy of its position and drop moves
+    # that leave the own king attacked (all resulting boards are tested at
+    # once)
+    posInd, fromSq, toSq = np.nonzero(masks)
+
+    for start in range(0, len(posInd), MOVES_CHUNK):
+        ind = slice(start, start + MOVES_CHUNK)
+        moveInd = np.arange(len(posInd[ind]))
+        boards = positions[posInd[ind]]
+
+        # En passant: pawn moves diagonally to an empty square
+        isEnPassant = (boards[moveInd, fromSq[ind]] == PAWN) \
+            & (fromSq[ind] % 8 != toSq[ind] % 8) \
+            & (boards[moveInd, toSq[ind]] == EMPTY)
+        boards[moveInd[isEnPassant], toSq[ind][isEnPassant] + 8] = EMPTY
+
+        boards[moveInd, toSq[ind]] = boards[moveInd, fromSq[ind]]
+        boards[moveInd, fromSq[ind]] = EMPTY
+
+        attacked = computeAttackMaps(
+            boards.reshape(-1, 8, 8))[:, 1].reshape(-1, 64)
+        kingSq = np.argmax(boards == KING, axis=1)
+        isIllegal = attacked[moveInd, kingSq]
+
+        masks[posInd[ind][isIllegal], fromSq[ind][isIllegal],
+              toSq[ind][isIllegal]] = False
+
+
+def batchLegalMoveMasks(positions: np.ndarray,
+                        lightToMove: Optional[np.ndarray] = None,
+                        castling: Optional[np.ndarray] = None,
+                        enPassant: Optional[np.ndarray] = None) -> np.ndarray:
+    # Input: (N, 64) int8 positions with piece codes, side to move, castling
+    # rights (4-bit) and squares of pawns capturable en passant (-1 if none).
+    # Output: (N, 64, 64) masks of legal moves [position, from, to]
+    positions = np.asarray(positions, dtype=np.int8).reshape(-1, 64)
+    count = len(positions)
+    lightToMove = np.ones(count, dtype=bool) if lightToMove is None \
+        else np.asarray(lightToMove, dtype=bool)
+    castling = np.zeros(count, dtype=np.int64) if castling is None \
+        else np.asarray(castling, dtype=np.int64)
+    enPassant = np.full(count, -1, dtype=np.int64) if enPassant is None \
+        else np.asarray(enPassant, dtype=np.int64)
+
+    masks = np.zeros((count, 64, 64), dtype=bool)
+    for start in range(0, count, POSITIONS_CHUNK):
+        ind = slice(start, start + POSITIONS_CHUNK)
+        chunk = normalizePositions(positions[ind], lightToMove[ind],
+                                   castling[ind], enPassant[ind])
+        chunkMasks = pseudoLegalMasks(*chunk)
+        filterLegalMoves(chunk[0], chunkMasks)
+        masks[ind] = chunkMasks
+
+    # Mirror moves of positions with dark to move back
+    dark = ~lightToMove
+    masks[dark] = masks[dark][:, FLIPPED_SQUARES][:, :, FLIPPED_SQUARES]
+
+    return masks
+
+
+def batchLegalMoveCounts(positions: np.ndarray,
+                         lightToMove: Optional[np.ndarray] = None,
+                         castling: Optional[np.ndarray] = None,
+                         enPassant: Optional[np.ndarray] = None) \
+        -> np.ndarray:
+    positions = np.asarray(positions, dtype=np.int8).reshape(-1, 64)
+    masks = batchLegalMoveMasks(positions, lightToMove, castling, enPassant)
+    counts = masks.sum(axis=(1, 2))
+
+    # Every promotion counts as four moves (one per piece)
+    pawns = np.abs(positions) == PAWN
+    promotions = masks[:, :, :8].sum(axis=2) + masks[:, :, 56:].sum(axis=2)
+    counts += 3 * (promotions * pawns).sum(axis=1)
+
+    return counts
@@ -1,16 +1,134 @@
 import re
-import itertools
+import random
 import numpy as np
-from typing import Dict, List, Tuple, Optional, Union, Sequence
+from array import array
+from functools import reduce
+from operator import xor
+from typing import Dict, List, Tuple, Optional, Union, Sequence, Iterator
+
+from logic.attack_map import (
+    EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, PIECE_CODES, PIECE_NAMES,
+    computeAttackMaps)
+from logic.moves import (
+    QUIET, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EN_PASSANT,
+    PROMOTION, PROMOTION_PIECES, CASTLE_LIGHT_KING, CASTLE_LIGHT_QUEEN,
+    CASTLE_DARK_KING, CASTLE_DARK_QUEEN, ALL_CASTLING_RIGHTS, KNIGHT_JUMPS,
+    KING_STEPS, RAYS, LINE_DIRECTIONS, SQUARES_MASK, encodeMove,
+    coordsToMove, moveStart, moveEnd, moveFlags, isTacticalMove,
+    promotionFlags, movePromotionPiece, moveToCoords)
+from logic.symmetry import (
+    COLOUR_FLIP, TRANSFORMS_COUNT, TRANSFORM_SQUARES, getValidTransforms,
+    transformCastling)
+
+# Zobrist keys (fixed seed, so hashes stay valid across sessions). Keys are
+# 63-bit to fit into a signed SQLite INTEGER
+_zobristRandom = random.Random(0x5EED)
+ZOBRIST_PIECES: Dict[int, List[int]] = {
+    PIECE_CODES[piece]: [_zobristRandom.getrandbits(63) for _ in range(64)]
+    for piece in "PNBRQKpnbrqk"
+}
+ZOBRIST_DARK_TO_MOVE: int = _zobristRandom.getrandbits(63)
+_castlingKeys = [_zobristRandom.getrandbits(63) for _ in range(4)]
+ZOBRIST_CASTLING: List[int] = [
+    reduce(xor, (key for bit, key in enumerate(_castlingKeys)
+                 if rights >> bit & 1), 0)
+    for rights in range(16)
+]
+ZOBRIST_EN_PASSANT: List[int] = [_zobristRandom.getrandbits(63)
+                                 for _ in range(8)]
+
+# Piece keys of all symmetric positions (logic/symmetry.py) packed into one
+# integer, a 64-bit chunk per transform: the hashes of all transformed
+# positions are updated with a single XOR
+HASH_CHUNK_BITS: int = 64
+HASH_CHUNK_MASK: int = (1 << HASH_CHUNK_BITS) - 1
+ZOBRIST_SYMMETRIC: Dict[int, List[int]] = {
+    code: [sum(ZOBRIST_PIECES[-code if transform & COLOUR_FLIP else code][
+               TRANSFORM_SQUARES[transform][sq]]
+               << (HASH_CHUNK_BITS * transform)
+               for transform in range(TRANSFORMS_COUNT))
+           for sq in range(64)]
+    for code in ZOBRIST_PIECES
+}
+
+# Number of positions with remembered attack maps, legal moves and SAN
+# tables
+ATTACK_MAP_CACHE_SIZE: int = 4096
+LEGAL_MOVES_CACHE_SIZE: int = 4096
+SAN_TABLE_CACHE_SIZE: int = 256
+
+# Algebraic notation: move text, its optional suffixes (check marks,
+# annotations, en passant) and names of the squares
+SAN_PATTERN = re.compile(
+    r"^([RNBQK]?)([a-h]?)([1-8]?)([x]?)([a-h][1-8])(=?[qrbnQRBN]?)$")
+SAN_SUFFIX_PATTERN = re.compile(r"\s*(e\.?p\.?)?[+#!?]*$")
+SQUARE_NAMES: List[str] = [chr(ord('a') + sq % 8) + str(8 - sq // 8)
+                           for sq in range(64)]
+
+# Value of SAN table keys shared by several moves
+AMBIGUOUS_MOVE: int = -1
+
+# Castling rights kept after a move from or to a square (kings and rooks
+# leaving their initial squares, rooks captured there)
+CASTLING_MASKS: List[int] = [ALL_CASTLING_RIGHTS] * 64
+CASTLING_MASKS[4] &= ~(CASTLE_DARK_KING | CASTLE_DARK_QUEEN)
+CASTLING_MASKS[60] &= ~(CASTLE_LIGHT_KING | CASTLE_LIGHT_QUEEN)
+CASTLING_MASKS[0] &= ~CASTLE_DARK_QUEEN
+CASTLING_MASKS[7] &= ~CASTLE_DARK_KING
+CASTLING_MASKS[56] &= ~CASTLE_LIGHT_QUEEN
+CASTLING_MASKS[63] &= ~CASTLE_LIGHT_KING
+
+# Fields of the compact state (see __getstate__)
+STATE_FIELDS: Tuple[str, ...] = (
+    'board', 'moveHistory', 'activePlayer', 'lastMove', 'boardHash',
+    'pawnHash', 'symmetricHash', 'hashHistory', 'halfmoveClock',
+    'fullmoveNumber', 'undoStack', 'playerMoved', 'check',
+    'enPassantPerformed',
+    'castlingPerformed', 'promotionPiece', 'enPassantSq', 'castlingRookPos',
+    'castlingRights'
+)
+
+# FEN of the initial position and castling rights letters with their bits
+START_FEN: str = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+FEN_CASTLING: Tuple[Tuple[str, int], ...] = (
+    ('K', CASTLE_LIGHT_KING), ('Q', CASTLE_LIGHT_QUEEN),
+    ('k', CASTLE_DARK_KING), ('q', CASTLE_DARK_QUEEN)
+)
+
+# Initial squares of the kings and the rooks (castling rights need them)
+CASTLING_PIECES: Tuple[Tuple[int, int], ...] = (
+    (4, -KING), (0, -ROOK), (7, -ROOK), (60, KING), (56, ROOK), (63, ROOK)
+)
 
 
 class ChessLogic:
+    __slots__ = STATE_FIELDS + ('attackMapCache', 'legalMovesCache',
+                                'sanTableCache')
+
     def __init__(self) -> None:
-        # Main parameters
-        self.textBoard: np.ndarray = np.full((8, 8), ".", dtype=str)
+        # Main parameters: 64 signed piece codes (index 8 * y + x, see
+        # logic/attack_map.py)
+        self.board: array = array('b', bytes(64))
         self.moveHistory: List[str] = []
         self.activePlayer: Optional[str] = None
-        self.lastMove: Optional[str] = None
+        self.lastMove: Optional[int] = None    # Packed move (logic/moves.py)
+        self.boardHash: int = 0     # Zobrist hash of the pieces only
+        self.pawnHash: int = 0      # Zobrist hash of the pawns only
+        self.symmetricHash: int = 0     # Packed piece hashes of transforms
+
+        # Attack maps, legal moves and SAN tables of recent positions (keyed
+        # by hashes, so any change of the position misses the cache)
+        self.attackMapCache: Dict[int, np.ndarray] = {}
+        self.legalMovesCache: Dict[int, array] = {}
+        self.sanTableCache: Dict[int, Tuple[Dict[str, int],
+                                            Dict[int, str]]] = {}
+
+        # Draw detection: position hashes after each move and the number of
+        # halfmoves since the last capture or pawn move
+        self.hashHistory: List[int] = []
+        self.halfmoveClock: int = 0
+        self.fullmoveNumber: int = 1
+        self.undoStack: List[Tuple] = []
 
         # Flags
         self.playerMoved: bool = False
@@ -18,18 +136,35 @@ class ChessLogic:
         self.enPassantPerformed: bool = False
         self.castlingPerformed: bool = False
 
-        # Additional parameters
+        # Additional parameters: square of the pawn which has just made a
+        # double step (-1 if none) and castling rights bits
         self.promotionPiece: Optional[str] = None
-        self.enPassantTarget: Optional[Tuple[int, int]] = None
+        self.enPassantSq: int = -1
         self.castlingRookPos: Optional[Tuple[int, int]] = None
-        self.castling: Dict[str, Dict[str, bool]] = {
-            'light': {'kingMoved': False,
-                      'leftRookMoved': False,
-                      'rightRookMoved': False},
-            'dark': {'kingMoved': False,
-                     'leftRookMoved': False,
-                     'rightRookMoved': False}
-        }
+        self.castlingRights: int = ALL_CASTLING_RIGHTS
+
+    def __getstate__(self) -> Tuple:
+        # Caches are not a part of the state
+        return tuple(getattr(self, field) for field in STATE_FIELDS)
+
+    def __setstate__(self, state: Tuple) -> None:
+        for field, value in zip(STATE_FIELDS, state):
+            setattr(self, field, value)
+        self.attackMapCache = {}
+        self.legalMovesCache = {}
+        self.sanTableCache = {}
+
+    def copy(self) -> 'ChessLogic':
+        logic = ChessLogic.__new__(ChessLogic)
+        logic.__setstate__(self.__getstate__())
+
+        # Mutable parts are not shared
+        logic.board = self.board[:]
+        logic.moveHistory = self.moveHistory[:]
+        logic.hashHistory = self.hashHistory[:]
+        logic.undoStack = self.undoStack[:]
+
+        return logic
 
     # -----------------
     # General functions
@@ -62,20 +197,81 @@ class ChessLogic:
     # ---------------
 
     def getPiece(self, x: int, y: int) -> str:
-        return self.textBoard[y, x]
+        return PIECE_NAMES[self.board[8 * y + x]]
 
     def setPiece(self, x: int, y: int, piece: str) -> None:
-        self.textBoard[y, x] = piece
+        self.setCode(8 * y + x, PIECE_CODES[piece])
+
+    def setCode(self, sq: int, code: int) -> None:
+        # Keep the Zobrist hash of the pieces up to date
+        oldCode = self.board[sq]
+        if oldCode != EMPTY:
+            self.boardHash ^= ZOBRIST_PIECES[oldCode][sq]
+            self.symmetricHash ^= ZOBRIST_SYMMETRIC[oldCode][sq]
+            if oldCode == PAWN or oldCode == -PAWN:
+                self.pawnHash ^= ZOBRIST_PIECES[oldCode][sq]
+        if code != EMPTY:
+            self.boardHash ^= ZOBRIST_PIECES[code][sq]
+            self.symmetricHash ^= ZOBRIST_SYMMETRIC[code][sq]
+            if code == PAWN or code == -PAWN:
+                self.pawnHash ^= ZOBRIST_PIECES[code][sq]
+
+        self.board[sq] = code
+
+    def getCodeBoard(self) -> np.ndarray:
+        # 8x8 view of the board (no copying)
+        return np.frombuffer(self.board, dtype=np.int8).reshape(8, 8)
+
+    def getPositionHash(self, side: Optional[str] = None) -> int:
+        positionHash = self.boardHash ^ ZOBRIST_CASTLING[self.castlingRights]
+
+        if (side or self.activePlayer) == "dark":
+            positionHash ^= ZOBRIST_DARK_TO_MOVE
+
+        # Target of an already performed en passant is not a part of position
+        if self.enPassantSq >= 0 and not self.enPassantPerformed:
+            positionHash ^= ZOBRIST_EN_PASSANT[self.enPassantSq % 8]
+
+        return positionHash
+
+    def pushPositionHash(self, side: Optional[str] = None) -> None:
+        self.hashHistory.append(self.getPositionHash(side))
 
     def findPiecesXY(self, piece: str) -> List[Tuple[int, int]]:
-        coords = np.where(self.textBoard == piece)
-        return list(zip(coords[1], coords[0]))
+        code = PIECE_CODES[piece]
+
+        return [(sq % 8, sq // 8)
+                for sq, squareCode in enumerate(self.board)
+                if squareCode == code]
 
     def getKingPos(self, isLight: bool) -> Tuple[int, int]:
-        piece = 'K' if isLight else 'k'
-        pos = np.where(np.array(self.textBoard) == piece)
+        kingSq = self.board.index(KING if isLight else -KING)
+
+        return kingSq % 8, kingSq // 8
+
+    # --------------
+    # Draw detection
+    # --------------
 
-        return pos[1][0], pos[0][0]
+    def getRepetitionCount(self) -> int:
+        if not self.hashHistory:
+            return 1
+
+        # Only positions after the last irreversible move can repeat (with the
+        # same side to move)
+        currentHash = self.hashHistory[-1]
+        firstInd = max(len(self.hashHistory) - 1 - self.halfmoveClock, 0)
+        count = sum(1 for ind in range(len(self.hashHistory) - 3,
+                                       firstInd - 1, -2)
+                    if self.hashHistory[ind] == currentHash)
+
+        return count + 1
+
+    def isThreefoldRepetition(self) -> bool:
+        return self.getRepetitionCount() >= 3
+
+    def isFiftyMoveRule(self) -> bool:
+        return self.halfmoveClock >= 100
 
     # ----------------------
     # Piece moving (general)
@@ -84,14 +280,28 @@ class ChessLogic:
     def movePiece(self, startX: int, startY: int,
                   newX: int, newY: int) -> None:
         piece = self.getPiece(startX, startY)
+        target = self.getPiece(newX, newY)
 
         # Check if the player has not changed the position of the piece
         if [newX, newY] == [startX, startY]:
             return
 
-        # Check if castling is possible
-        if piece.lower() == 'k' \
-                and [newX, newY] in self.getCastlingMoves(startX, startY):
+        # Remember the initial position for the repetition detection
+        if not self.hashHistory:
+            self.pushPositionHash()
+
+        # Convert move coordinates to the move according to SAN notation
+        sanMove = self.coordsToSAN(startX, startY, newX, newY)
+
+        # Count halfmoves since the last capture or pawn move and full moves
+        self.halfmoveClock = 0 \
+            if piece.lower() == 'p' or target != '.' \
+            else self.halfmoveClock + 1
+        if piece.islower():
+            self.fullmoveNumber += 1
+
+        # Check if castling is performed (only castling moves king by 2)
+        if piece.lower() == 'k' and abs(newX - startX) == 2:
             rookStartX, rookNewX = 7 if newX - startX > 0 \
                 else 0, (newX + startX) // 2
             rookPiece = self.getPiece(rookStartX, startY)
@@ -101,249 +311,498 @@ class ChessLogic:
             self.setPiece(rookNewX, startY, rookPiece)
             self.setPiece(rookStartX, startY, '.')
 
-            # Changing flags related to the movements of the rooks
-            if startY == (0 if self.activePlayer == "dark" else 7):
-                if rookStartX == 0:
-                    self.castling[self.activePlayer]['leftRookMoved'] = True
-                elif rookStartX == 7:
-                    self.castling[self.activePlayer]['rightRookMoved'] = True
-
-        # Change flags related to the movements of the kings and the rooks
-        if piece.lower() == 'k':
-            self.castling[self.activePlayer]['kingMoved'] = True
-        elif piece.lower() == 'r':
-            if startY == (0 if self.activePlayer == "dark" else 7):
-                if startX == 0:
-                    self.castling[self.activePlayer]['leftRookMoved'] = True
-                elif startX == 7:
-                    self.castling[self.activePlayer]['rightRookMoved'] = True
+        # Change castling rights related to the movements of the kings and
+        # the rooks
+        self.updateCastlingRights(8 * startY + startX, 8 * newY + newX)
 
         # Check if en passant is possible
-        if self.enPassantTarget is not None:
-            x, y = self.enPassantTarget
+        if self.enPassantSq >= 0:
+            x, y = self.enPassantSq % 8, self.enPassantSq // 8
             if (piece == 'P' and self.getPiece(x, y) == 'p') \
                     or (piece == 'p' and self.getPiece(x, y) == 'P'):
-                if (newX, newY + (1 if piece.isupper() else -1)) \
-                        == self.enPassantTarget:
-                    self.setPiece(*self.enPassantTarget, '.')
+                if (newX, newY + (1 if piece.isupper() else -1)) == (x, y):
+                    self.setPiece(x, y, '.')
                     self.enPassantPerformed = True
 
         # Check if en passant is not performed
         if not self.enPassantPerformed:
-            self.enPassantTarget = (newX, newY) \
-                if piece.lower() == 'p' and abs(newY - startY) == 2 else None
-
-        # Convert move coordinates to the move according to SAN notation
-        sanMove = self.coordsToSAN(startX, startY, newX, newY)
+            self.enPassantSq = 8 * newY + newX \
+                if piece.lower() == 'p' and abs(newY - startY) == 2 else -1
 
         # Perform move
         self.setPiece(newX, newY, piece)
         self.setPiece(startX, startY, '.')
 
-        # Add additional chars to move in SAN
-        if self.isInCheck(not self.activePlayer == 'light')[2]:
-            sanMove += '#' \
-                if self.isCheckmate(not self.activePlayer == 'light') else '+'
-
-        # Remember and add performed move to the history
-        self.lastMove = f"{startX}{startY}{newX}{newY}"
-        self.lastMove += f"{self.promotionPiece}" \
-            if self.promotionPiece else ""
+        # Remember performed move
+        if self.castlingPerformed:
+            flags = KING_CASTLE if newX > startX else QUEEN_CASTLE
+        elif self.enPassantPerformed:
+            flags = EN_PASSANT
+        elif self.promotionPiece:
+            flags = promotionFlags(self.promotionPiece, target != '.')
+        elif piece.lower() == 'p' and abs(newY - startY) == 2:
+            flags = DOUBLE_PUSH
+        else:
+            flags = CAPTURE if target != '.' else QUIET
+        self.lastMove = coordsToMove(startX, startY, newX, newY, flags)
+
+        # Add additional chars to move in SAN (the chosen promotion piece is
+        # already on the board for the mate test)
+        self.check = self.isCheckAfterMove(self.lastMove)
+        if self.check and not self.promotionPiece:
+            sanMove += '+' if self.hasLegalMove(piece.islower()) else '#'
+        elif self.check:
+            self.setPiece(newX, newY, self.promotionPiece)
+            sanMove += '+' if self.hasLegalMove(piece.islower()) else '#'
+            self.setPiece(newX, newY, piece)
+
+        # Add performed move to the history
         self.moveHistory.append(sanMove)
+        self.pushPositionHash("dark" if piece.isupper() else "light")
 
-    def testMovePiece(self, startX: int, startY: int,
-                      newX: int, newY: int) -> None:
-        piece = self.getPiece(startX, startY)
+    def updateCastlingRights(self, startSq: int, endSq: int) -> None:
+        self.castlingRights &= CASTLING_MASKS[startSq] & CASTLING_MASKS[endSq]
 
-        # En passant analyzing
-        if self.enPassantPerformed:
-            target = 'p' if piece.isupper() else 'P'
-            self.setPiece(*self.enPassantTarget, target)
-            self.enPassantPerformed = False
-        elif self.enPassantTarget is not None:
-            x, y = self.enPassantTarget
-            if (piece == 'P' and self.getPiece(x, y) == 'p') \
-                    or (piece == 'p' and self.getPiece(x, y) == 'P'):
-                if (newX, newY + (1 if piece.isupper() else -1)) \
-                        == self.enPassantTarget:
-                    self.setPiece(*self.enPassantTarget, '.')
-                    self.enPassantPerformed = True
-
-        self.setPiece(newX, newY, piece)
-        self.setPiece(startX, startY, '.')
-
-    def simulateMove(self, x1: int, y1: int,
-                     x2: int, y2: int, piece: str) -> bool:
-        target = self.getPiece(x2, y2)
-
-        self.testMovePiece(x1, y1, x2, y2)
-        inCheck = self.isInCheck(piece.isupper())[2]
-        self.testMovePiece(x2, y2, x1, y1)
-
-        if target != '.':
-            self.setPiece(x2, y2, target)
+    # ---------------
+    # Move generation
+    # ---------------
 
-        return inCheck
+    def getSquares(self) -> array:
+        # Copy of the board for generation (legality tests change it)
+        return self.board[:]
 
-    def getLegalMoves(self, x: int, y: int) -> List[List[int]]:
-        possibleMoves = self.getPossibleMoves(x, y)
-        piece = self.getPiece(x, y)
+    def iterPseudoMoves(self, squares: array,
+                        isLight: bool) -> Iterator[int]:
+        for sq, code in enumerate(squares):
+            if code != EMPTY and (code > EMPTY) == isLight:
+                yield from self.iterPieceMoves(squares, sq, code)
 
-        # Castling analyzing
-        if piece.lower() == 'k':
-            castlingMoves = self.getCastlingMoves(x, y)
-            if castlingMoves:
-                possibleMoves.extend(castlingMoves)
+    def iterPieceMoves(self, squares: array, sq: int,
+                       code: int) -> Iterator[int]:
+        isLight = code > EMPTY
+        pieceType = abs(code)
 
-        legalMoves = [[newX, newY] for newX, newY in possibleMoves
-                      if not self.simulateMove(x, y, newX, newY, piece)]
+        if pieceType == PAWN:
+            yield from self.iterPawnMoves(squares, sq, isLight)
+            return
 
-        return legalMoves
+        if pieceType == KNIGHT or pieceType == KING:
+            targets = KNIGHT_JUMPS[sq] if pieceType == KNIGHT \
+                else KING_STEPS[sq]
+            for endSq in targets:
+                target = squares[endSq]
+                if target == EMPTY:
+                    yield encodeMove(sq, endSq)
+                elif (target > EMPTY) != isLight:
+                    yield encodeMove(sq, endSq, CAPTURE)
+
+            if pieceType == KING:
+                yield from self.iterCastlingMoves(squares, sq, isLight)
+            return
 
-    def getPossibleMoves(self, x: int, y: int) -> List[List[int]]:
-        piece = self.getPiece(x, y)
-        movesDict = {
-            'p': self.getPawnMoves,
-            'n': self.getKnightMoves,
-            'r': self.getRookMoves,
-            'b': self.getBishopMoves,
-            'q': self.getQueenMoves,
-            'k': self.getKingMoves,
-        }
+        # Sliding pieces (orthogonal rays go first)
+        rays = RAYS[sq][:4] if pieceType == ROOK \
+            else RAYS[sq][4:] if pieceType == BISHOP else RAYS[sq]
+        for ray in rays:
+            for endSq in ray:
+                target = squares[endSq]
+                if target == EMPTY:
+                    yield encodeMove(sq, endSq)
+                    continue
+
+                if (target > EMPTY) != isLight:
+                    yield encodeMove(sq, endSq, CAPTURE)
+                break
+
+    def iterPawnMoves(self, squares: array, sq: int,
+                      isLight: bool) -> Iterator[int]:
+        x, y = sq % 8, sq // 8
+        step = -8 if isLight else 8
+        isLastRank = (y + step // 8) in (0, 7)
+
+        # Pushes
+        if squares[sq + step] == EMPTY:
+            if isLastRank:
+                for ind in range(4):
+                    yield encodeMove(sq, sq + step, PROMOTION | ind)
+            else:
+                yield encodeMove(sq, sq + step)
+                if y == (6 if isLight else 1) \
+                        and squares[sq + 2 * step] == EMPTY:
+                    yield encodeMove(sq, sq + 2 * step, DOUBLE_PUSH)
+
+        # Captures
+        for dx in (-1, 1):
+            if not 0 <= x + dx < 8:
+                continue
+
+            endSq = sq + step + dx
+            target = squares[endSq]
+            if target == EMPTY or (target > EMPTY) == isLight:
+                continue
+
+            if isLastRank:
+                for ind in range(4):
+                    yield encodeMove(sq, endSq, PROMOTION | CAPTURE | ind)
+            else:
+                yield encodeMove(sq, endSq, CAPTURE)
+
+        # En passant (target is the pawn which has just made a double step)
+        enPassantSq = self.enPassantSq
+        if enPassantSq >= 0 and enPassantSq // 8 == y \
+                and abs(enPassantSq % 8 - x) == 1 \
+                and squares[enPassantSq] == (-PAWN if isLight else PAWN):
+            yield encodeMove(sq, enPassantSq + step, EN_PASSANT)
+
+    def iterCastlingMoves(self, squares: array, sq: int,
+                          isLight: bool) -> Iterator[int]:
+        kingSide, queenSide = \
+            (CASTLE_LIGHT_KING, CASTLE_LIGHT_QUEEN) if isLight \
+            else (CASTLE_DARK_KING, CASTLE_DARK_QUEEN)
+
+        # Check if the king has already been moved or is in check
+        if not self.castlingRights & (kingSide | queenSide) \
+                or sq != (60 if isLight else 4) \
+                or self.isSquareAttackedOn(squares, sq, not isLight):
+            return
 
-        if piece.lower() in movesDict:
-            return movesDict[piece.lower()](x, y)
+        # King crosses two squares towards the rook; these must be free and
+        # not attacked
+        rook = ROOK if isLight else -ROOK
+        if self.castlingRights & kingSide and squares[sq + 3] == rook \
+                and squares[sq + 1] == squares[sq + 2] == EMPTY \
+                and not self.isSquareAttackedOn(squares, sq + 1, not isLight) \
+                and not self.isSquareAttackedOn(squares, sq + 2, not isLight):
+            yield encodeMove(sq, sq + 2, KING_CASTLE)
+
+        if self.castlingRights & queenSide and squares[sq - 4] == rook \
+                and squares[sq - 1] == squares[sq - 2] == squares[sq - 3] \
+                == EMPTY \
+                and not self.isSquareAttackedOn(squares, sq - 1, not isLight) \
+                and not self.isSquareAttackedOn(squares, sq - 2, not isLight):
+            yield encodeMove(sq, sq - 2, QUEEN_CASTLE)
+
+    def iterCaptureMoves(self, squares: array,
+                         isLight: bool) -> Iterator[int]:
+        # Captures, en passant and promotions only (other moves are quiet)
+        for sq, code in enumerate(squares):
+            if code == EMPTY or (code > EMPTY) != isLight:
+                continue
+
+            pieceType = abs(code)
+            if pieceType == PAWN:
+                for move in self.iterPawnMoves(squares, sq, isLight):
+                    if isTacticalMove(move):
+                        yield move
+                continue
+
+            if pieceType == KNIGHT or pieceType == KING:
+                targets = KNIGHT_JUMPS[sq] if pieceType == KNIGHT \
+                    else KING_STEPS[sq]
+                for endSq in targets:
+                    target = squares[endSq]
+                    if target != EMPTY and (target > EMPTY) != isLight:
+                        yield encodeMove(sq, endSq, CAPTURE)
+                continue
+
+            # Sliding pieces capture the first piece on a ray
+            rays = RAYS[sq][:4] if pieceType == ROOK \
+                else RAYS[sq][4:] if pieceType == BISHOP else RAYS[sq]
+            for ray in rays:
+                for endSq in ray:
+                    target = squares[endSq]
+                    if target != EMPTY:
+                        if (target > EMPTY) != isLight:
+                            yield encodeMove(sq, endSq, CAPTURE)
+                        break
+
+    def isPseudoLegalMove(self, squares: array, move: int,
+                          isLight: bool) -> bool:
+        # Check a move from elsewhere (e.g. remembered by the search)
+        code = squares[moveStart(move)]
+
+        return code != EMPTY and (code > EMPTY) == isLight \
+            and move in self.iterPieceMoves(squares, moveStart(move), code)
 
-        return []
+    @staticmethod
+    def isSquareAttackedOn(squares: array, sq: int, byLight: bool) -> bool:
+        # Look from the square for attackers of the given side
+        sign = 1 if byLight else -1
+        pawn, knight, bishop, rook, queen, king = \
+            sign * PAWN, sign * KNIGHT, sign * BISHOP, sign * ROOK, \
+            sign * QUEEN, sign * KING
+
+        if any(squares[endSq] == knight for endSq in KNIGHT_JUMPS[sq]) \
+                or any(squares[endSq] == king for endSq in KING_STEPS[sq]):
+            return True
 
-    def getPawnMoves(self, x: int, y: int) -> List[List[int]]:
-        piece = self.getPiece(x, y)
-        moveDir = 1 if piece.islower() else -1
+        x, pawnSq = sq % 8, sq + (8 if byLight else -8)
+        if 0 <= pawnSq < 64 \
+                and ((x > 0 and squares[pawnSq - 1] == pawn)
+                     or (x < 7 and squares[pawnSq + 1] == pawn)):
+            return True
 
-        regularMoves = []
-        if 0 <= y + moveDir < 8:
-            if self.getPiece(x, y + moveDir) == '.':
-                regularMoves.append([x, y + moveDir])
-                if (y == 1 and piece.islower()) \
-                        or (y == 6 and piece.isupper()):
-                    if self.getPiece(x, y + 2 * moveDir) == '.':
-                        regularMoves.append([x, y + 2 * moveDir])
+        for ind, ray in enumerate(RAYS[sq]):
+            slider = rook if ind < 4 else bishop
+            for endSq in ray:
+                target = squares[endSq]
+                if target != EMPTY:
+                    if target == slider or target == queen:
+                        return True
+                    break
 
-        # Check if en passant is possible
-        if self.enPassantTarget is not None:
-            enX, enY = self.enPassantTarget
-            if y == enY and (x - 1 == enX or x + 1 == enX) \
-                    and 0 <= enY + moveDir < 8:
-                regularMoves.append([enX, enY + moveDir])
+        return False
 
-        captureMoves = [[x + dx, y + moveDir] for dx in (-1, 1)
-                        if 0 <= x + dx < 8 and 0 <= y + moveDir < 8
-                        and self.getPiece(x + dx, y + moveDir).isupper()
-                        != piece.isupper()
-                        and self.getPiece(x + dx, y + moveDir) != '.']
+    def isMoveLegal(self, squares: array, move: int, kingSq: int) -> bool:
+        # Make move on the board copy and check if own king is attacked
+        startSq, endSq = moveStart(move), moveEnd(move)
+        code, target = squares[startSq], squares[endSq]
+        isLight = code > EMPTY
 
-        return regularMoves + captureMoves
+        squares[endSq], squares[startSq] = code, EMPTY
+        if moveFlags(move) == EN_PASSANT:
+            capturedSq = endSq + (8 if isLight else -8)
+            captured, squares[capturedSq] = squares[capturedSq], EMPTY
 
-    def getRookMoves(self, x: int, y: int) -> List[List[int]]:
-        piece = self.getPiece(x, y)
-        rookShifts = np.array([(1, 0), (-1, 0), (0, 1), (0, -1)])
+        isLegal = not self.isSquareAttackedOn(
+            squares, endSq if abs(code) == KING else kingSq, not isLight)
 
-        moves = [move for shift in rookShifts
-                 for move in self.rookMoveCalculations(piece, x, y, shift)]
+        # Take move back
+        squares[startSq], squares[endSq] = code, target
+        if moveFlags(move) == EN_PASSANT:
+            squares[capturedSq] = captured
 
-        return moves
+        return isLegal
 
-    def rookMoveCalculations(self, piece: str, x: int, y: int,
-                             shift: Tuple[int, int]) -> List[List[int]]:
-        allInd = np.array([(i * shift[0] + x, i * shift[1] + y)
-                           for i in range(1, 8)])
-        validInd = np.all((allInd >= 0) & (allInd < 8), axis=1)
-        validPos = allInd[validInd]
-
-        targetPieces = [self.getPiece(*pos) for pos in validPos]
-        firstNonEmpty = next(
-            (i for i, p in enumerate(targetPieces) if p != '.'),
-            len(targetPieces))
-
-        if firstNonEmpty < len(targetPieces) \
-                and targetPieces[firstNonEmpty].isupper() != piece.isupper():
-            return validPos[:firstNonEmpty + 1].tolist()
-        else:
-            return validPos[:firstNonEmpty].tolist()
+    def generateLegalMoves(self, isLight: Optional[bool] = None) -> array:
+        # Moves are generated once per position and side; the returned array
+        # is shared, so it must not be changed
+        if isLight is None:
+            isLight = (self.activePlayer == "light")
 
-    def getKnightMoves(self, x: int, y: int) -> List[List[int]]:
-        piece = self.getPiece(x, y)
-        knightShifts = [(1, 2), (2, 1), (-1, 2), (-2, 1),
-                        (1, -2), (2, -1), (-1, -2), (-2, -1)]
+        key = self.getPositionHash("light" if isLight else "dark")
+        moves = self.legalMovesCache.get(key)
+        if moves is None:
+            if len(self.legalMovesCache) >= LEGAL_MOVES_CACHE_SIZE:
+                self.legalMovesCache.clear()
 
-        moves = [[x + dx, y + dy]
-                 for dx, dy in knightShifts
-                 if 0 <= x + dx < 8
-                 and 0 <= y + dy < 8
-                 and (self.getPiece(x + dx, y + dy) == '.'
-                 or self.getPiece(x + dx, y + dy).isupper()
-                 != piece.isupper())]
+            moves = self.computeLegalMoves(isLight)
+            self.legalMovesCache[key] = moves
 
         return moves
 
-    def getBishopMoves(self, x: int, y: int) -> List[List[int]]:
-        piece = self.getPiece(x, y)
-        bishopShifts = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
-
-        moves = [move for shift in bishopShifts
-                 for move in self.bishopMoveCalculations(piece, x, y, *shift)]
-
-        return moves
+    def computeLegalMoves(self, isLight: bool) -> array:
+        squares = self.getSquares()
+        kingSq = squares.index(KING if isLight else -KING)
 
-    def bishopMoveCalculations(self, piece: str, x: int, y: int,
-                               dx: int, dy: int) -> List[List[int]]:
-        validPos = [[x + i * dx, y + i * dy]
-                    for i in range(1, 8)
-                    if 0 <= x + i * dx < 8 and 0 <= y + i * dy < 8
-                    and (self.getPiece(x + i * dx, y + i * dy) == '.'
-                    or self.getPiece(x + i * dx, y + i * dy).isupper()
-                    != piece.isupper())
-                    and not any(self.getPiece(x + j * dx, y + j * dy)
-                                != '.' for j in range(1, i))]
+        return array('H', (move
+                           for move in self.iterPseudoMoves(squares, isLight)
+                           if self.isMoveLegal(squares, move, kingSq)))
 
-        return validPos
+    def getLegalMoves(self, x: int, y: int) -> List[List[int]]:
+        code = self.board[8 * y + x]
+        if code == EMPTY:
+            return []
+
+        # End squares of legal moves (promotions to any piece count once)
+        legalMoves = []
+        for move in self.generateLegalMoves(code > EMPTY):
+            endSq = moveEnd(move)
+            if moveStart(move) == 8 * y + x \
+                    and [endSq % 8, endSq // 8] not in legalMoves:
+                legalMoves.append([endSq % 8, endSq // 8])
 
-    def getQueenMoves(self, x: int, y: int) -> List[List[int]]:
-        return self.getBishopMoves(x, y) + self.getRookMoves(x, y)
+        return legalMoves
 
-    def getKingMoves(self, x: int, y: int) -> List[List[int]]:
-        piece = self.getPiece(x, y)
-        kingShifts = [(1, 1), (-1, 1), (1, -1), (-1, -1),
-                      (1, 0), (-1, 0), (0, 1), (0, -1)]
+    # ---------------------
+    # Piece moving (search)
+    # ---------------------
 
-        moves = [[x + dx, y + dy]
-                 for dx, dy in kingShifts
-                 if 0 <= x + dx < 8 and 0 <= y + dy < 8
-                 and (self.getPiece(x + dx, y + dy) == '.'
-                 or self.getPiece(x + dx, y + dy).isupper()
-                 != piece.isupper())]
+    @staticmethod
+    def getPromotionCode(flags: int, isLight: bool) -> int:
+        code = PIECE_CODES[PROMOTION_PIECES[flags & 3].upper()]
+
+        return code if isLight else -code
+
+    def getMoveChanges(self, move: int) \
+            -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+        # Pieces (code, square) removed from the board and put on it by the
+        # move, which is not made yet
+        startSq, endSq, flags = moveStart(move), moveEnd(move), moveFlags(move)
+        code, target = self.board[startSq], self.board[endSq]
+
+        removed = [(code, startSq)]
+        if target != EMPTY:
+            removed.append((target, endSq))
+        added = [(self.getPromotionCode(flags, code > EMPTY)
+                  if flags & PROMOTION else code, endSq)]
+
+        if flags == EN_PASSANT:
+            capturedSq = endSq + (8 if code > EMPTY else -8)
+            removed.append((self.board[capturedSq], capturedSq))
+        elif flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            rookSq = startSq + 3 if flags == KING_CASTLE else startSq - 4
+            removed.append((self.board[rookSq], rookSq))
+            added.append((self.board[rookSq], (startSq + endSq) // 2))
+
+        return removed, added
+
+    def makeMove(self, move: int) -> None:
+        startSq, endSq, flags = moveStart(move), moveEnd(move), moveFlags(move)
+        code, target = self.board[startSq], self.board[endSq]
+
+        # Remember the initial position for the repetition detection
+        if not self.hashHistory:
+            self.pushPositionHash()
+
+        # Save everything that is needed to take the move back
+        self.undoStack.append((move, code, target, self.enPassantSq,
+                               self.castlingRights, self.halfmoveClock,
+                               self.check))
+
+        if flags == EN_PASSANT:
+            self.setCode(endSq + (8 if code > EMPTY else -8), EMPTY)
+        elif flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            # Rook jumps over the king
+            rookSq = startSq + 3 if flags == KING_CASTLE else startSq - 4
+            self.setCode((startSq + endSq) // 2, self.board[rookSq])
+            self.setCode(rookSq, EMPTY)
+
+        self.updateCastlingRights(startSq, endSq)
+        self.enPassantSq = endSq if flags == DOUBLE_PUSH else -1
+        self.halfmoveClock = 0 \
+            if abs(code) == PAWN or target != EMPTY \
+            else self.halfmoveClock + 1
+        if code < EMPTY:
+            self.fullmoveNumber += 1
+
+        if flags & PROMOTION:
+            code = self.getPromotionCode(flags, code > EMPTY)
 
-        return moves
+        # Perform move
+        self.setCode(endSq, code)
+        self.setCode(startSq, EMPTY)
+        self.check = self.isCheckAfterMove(move)
+        self.switchActivePlayer()
+        self.pushPositionHash()
+
+    def unmakeMove(self) -> None:
+        move, code, target, self.enPassantSq, self.castlingRights, \
+            self.halfmoveClock, self.check = self.undoStack.pop()
+        startSq, endSq, flags = moveStart(move), moveEnd(move), moveFlags(move)
+
+        self.setCode(startSq, code)
+        self.setCode(endSq, target)
+        if code < EMPTY:
+            self.fullmoveNumber -= 1
+
+        if flags == EN_PASSANT:
+            # Restore the pawn captured en passant
+            self.setCode(endSq + (8 if code > EMPTY else -8),
+                         -PAWN if code > EMPTY else PAWN)
+        elif flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            # Restore the rook after castling
+            rookSq = startSq + 3 if flags == KING_CASTLE else startSq - 4
+            self.setCode(rookSq, self.board[(startSq + endSq) // 2])
+            self.setCode((startSq + endSq) // 2, EMPTY)
+
+        self.switchActivePlayer()
+        self.hashHistory.pop()
 
     # ----------------------
     # Piece moving (special)
     # ----------------------
 
-    def isSquareAttacked(self, x: int, y: int, isLight: bool) -> bool:
-        iAttacked = any([x, y] in self.getPossibleMoves(attackX, attackY)
-                        for attackX, attackY in itertools.product(range(8),
-                                                                  range(8))
-                        if self.getPiece(attackX, attackY) != '.'
-                        and self.getPiece(attackX, attackY).isupper()
-                        != isLight)
+    def getAttackMap(self, isLight: bool) -> np.ndarray:
+        # Squares attacked by one side (computed once per position) for
+        # check queries; move generation and castling probe single squares
+        # with isSquareAttackedOn, which is cheaper than a whole map there
+        attackMaps = self.attackMapCache.get(self.boardHash)
+        if attackMaps is None:
+            if len(self.attackMapCache) >= ATTACK_MAP_CACHE_SIZE:
+                self.attackMapCache.clear()
 
-        return iAttacked
+            attackMaps = computeAttackMaps(self.getCodeBoard())
+            self.attackMapCache[self.boardHash] = attackMaps
+
+        return attackMaps[0 if isLight else 1]
+
+    def isSquareAttacked(self, x: int, y: int, isLight: bool) -> bool:
+        # Check if the square is attacked by the opponent of the given side
+        return bool(self.getAttackMap(not isLight)[y, x])
 
     def isInCheck(self, isLight: bool) -> Tuple[int, int, bool]:
         kingX, kingY = self.getKingPos(isLight)
 
         return kingX, kingY, self.isSquareAttacked(kingX, kingY, isLight)
 
+    def isCheckAfterMove(self, move: int) -> bool:
+        # Check by the move which has just been made: the moved piece (or the
+        # rook after castling) attacks the king or a slider is discovered
+        # through a vacated square
+        startSq, endSq, flags = moveStart(move), moveEnd(move), moveFlags(move)
+        code = self.board[endSq]
+        if flags & PROMOTION:
+            code = self.getPromotionCode(flags, code > EMPTY)
+
+        isLight = code > EMPTY
+        kingSq = self.board.index(-KING if isLight else KING)
+
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            rookSq = (startSq + endSq) // 2
+            return self.isSquareAttackedBy(rookSq, self.board[rookSq], kingSq)
+
+        if self.isSquareAttackedBy(endSq, code, kingSq) \
+                or self.isDiscoveredAttack(startSq, kingSq, isLight):
+            return True
+
+        # En passant vacates the square of the captured pawn too
+        return flags == EN_PASSANT and self.isDiscoveredAttack(
+            endSq + (8 if isLight else -8), kingSq, isLight)
+
+    def isSquareAttackedBy(self, sq: int, code: int, targetSq: int) -> bool:
+        # Check if the piece on the square attacks the target square
+        pieceType = abs(code)
+
+        if pieceType == PAWN:
+            return targetSq - sq in ((-9, -7) if code > EMPTY else (7, 9)) \
+                and abs(targetSq % 8 - sq % 8) == 1
+        if pieceType == KNIGHT:
+            return targetSq in KNIGHT_JUMPS[sq]
+        if pieceType == KING:
+            return targetSq in KING_STEPS[sq]
+
+        # Sliding pieces: the line to the target square must be free
+        direction = LINE_DIRECTIONS[sq][targetSq]
+        if direction < 0 or (pieceType == ROOK and direction >= 4) \
+                or (pieceType == BISHOP and direction < 4):
+            return False
+
+        for endSq in RAYS[sq][direction]:
+            if endSq == targetSq:
+                return True
+            if self.board[endSq] != EMPTY:
+                return False
+
+        return False
+
+    def isDiscoveredAttack(self, vacatedSq: int, kingSq: int,
+                           isLight: bool) -> bool:
+        # Look from the king through the vacated square for a slider of the
+        # given side
+        direction = LINE_DIRECTIONS[kingSq][vacatedSq]
+        if direction < 0:
+            return False
+
+        slider = ROOK if direction < 4 else BISHOP
+        for endSq in RAYS[kingSq][direction]:
+            code = self.board[endSq]
+            if code != EMPTY:
+                return (code > EMPTY) == isLight \
+                    and abs(code) in (slider, QUEEN)
+
+        return False
+
     def isCheck(self, side: str) -> Tuple[int, int, bool]:
         isLight = (self.activePlayer == side)
 
@@ -353,20 +812,49 @@ class ChessLogic:
         if not self.isInCheck(isLight)[2]:
             return False
 
-        isCheckmate = not any(self.getLegalMoves(x, y)
-                              for x, y in itertools.product(range(8), range(8))
-                              if self.getPiece(x, y) != '.'
-                              and self.getPiece(x, y).isupper() == isLight)
+        return not self.hasLegalMove(isLight)
 
-        return isCheckmate
+    def hasLegalMove(self, isLight: bool) -> bool:
+        # Full list is cached and reused by the following move choice
+        return len(self.generateLegalMoves(isLight)) > 0
+
+    def isInsufficientMaterial(self) -> bool:
+        pieces = [(sq, abs(code)) for sq, code in enumerate(self.board)
+                  if code != EMPTY and abs(code) != KING]
+
+        # Lone kings or a single minor piece
+        if len(pieces) == 0 \
+                or (len(pieces) == 1 and pieces[0][1] in (KNIGHT, BISHOP)):
+            return True
+
+        # Only bishops, all of them on squares of the same color
+        return all(pieceType == BISHOP for _, pieceType in pieces) \
+            and len({(sq % 8 + sq // 8) % 2 for sq, _ in pieces}) == 1
+
+    def gameStatus(self) -> Optional[str]:
+        # Cheap checks first
+        if self.isInsufficientMaterial():
+            return "insufficient material"
+        if self.isThreefoldRepetition():
+            return "threefold repetition"
+        if self.isFiftyMoveRule():
+            return "fifty-move rule"
+
+        # Game goes on while the active player has any legal move
+        isLight = (self.activePlayer == "light")
+        if self.hasLegalMove(isLight):
+            return None
+
+        return "checkmate" if self.isInCheck(isLight)[2] else "stalemate"
 
     def isEnPassant(self) -> Tuple[bool, Optional[Tuple[int, int]]]:
         enPassantPerformed = self.enPassantPerformed
-        target = self.enPassantTarget
+        target = (self.enPassantSq % 8, self.enPassantSq // 8) \
+            if self.enPassantSq >= 0 else None
 
         if enPassantPerformed:
             self.enPassantPerformed = False
-            self.enPassantTarget = None
+            self.enPassantSq = -1
 
         return enPassantPerformed, target
 
@@ -399,47 +887,10 @@ class ChessLogic:
 
         self.setPiece(x, y, newPieceName)
 
-    def getCastlingMoves(self, x: int, y: int) -> List[List[int]]:
-        king = self.getPiece(x, y)
-        kingSide = "light" if king.isupper() else "dark"
-        moves = []
-
-        # Check if the king has already been moved
-        if self.castling[kingSide]['kingMoved']:
-            return moves
-
-        isLight = (kingSide == "light")
-
-        if not self.castling[kingSide]['leftRookMoved']:
-            if self.isPathClear(x, y, "left") \
-                    and not self.isKingCrossingAttackedSquares(x, y, "left",
-                                                               isLight):
-                moves.append([x - 2, y])
-
-        if not self.castling[kingSide]['rightRookMoved']:
-            if self.isPathClear(x, y, "right") \
-                    and not self.isKingCrossingAttackedSquares(x, y, "right",
-                                                               isLight):
-                moves.append([x + 2, y])
-
-        return moves
-
-    def isPathClear(self, x: int, y: int, direction: str) -> bool:
-        if direction == "left":
-            return all(self.getPiece(i, y) == '.' for i in range(x - 1, 0, -1))
-        elif direction == "right":
-            return all(self.getPiece(i, y) == '.' for i in range(x + 1, 7))
-
-    def isKingCrossingAttackedSquares(self, x: int, y: int,
-                                      direction: str, isLight: bool) -> bool:
-        if direction == "left":
-            return self.isSquareAttacked(x, y, isLight) \
-                   or self.isSquareAttacked(x - 1, y, isLight) \
-                   or self.isSquareAttacked(x - 2, y, isLight)
-        elif direction == "right":
-            return self.isSquareAttacked(x, y, isLight) \
-                   or self.isSquareAttacked(x + 1, y, isLight) \
-                   or self.isSquareAttacked(x + 2, y, isLight)
+        # Promotion belongs to the last move - correct its position hash
+        if self.hashHistory:
+            self.hashHistory[-1] = self.getPositionHash(
+                "dark" if piece.isupper() else "light")
 
     # ------------------------
     # Algebraic notation block
@@ -447,25 +898,29 @@ class ChessLogic:
 
     def parseMove(self, moveText: str) \
             -> Union[None, str, Tuple[int, int, int, int, Optional[str]]]:
-        # Remove spaces from text
-        moveText = moveText.strip()
+        # Remove spaces, check marks and en passant suffix from text
+        moveText = SAN_SUFFIX_PATTERN.sub('', moveText.strip())
 
+        # Look the move up among the legal moves of the position
+        move = self.getSANTable()[0].get(moveText, AMBIGUOUS_MOVE)
+        if move != AMBIGUOUS_MOVE:
+            startX, startY, endX, endY, promotionPiece = moveToCoords(move)
+            if promotionPiece and self.board[moveStart(move)] > EMPTY:
+                promotionPiece = promotionPiece.upper()
+
+            return startX, startY, endX, endY, promotionPiece
+
+        # Otherwise find out why the move is not legal
+        return self.explainMove(moveText)
+
+    def explainMove(self, moveText: str) \
+            -> Union[None, str, Tuple[int, int, int, int, Optional[str]]]:
         # Check for castling combination
         if moveText in ["O-O", "O-O-O", "0-0", "0-0-0"]:
-            piece = 'K' if self.activePlayer == 'light' else 'k'
-            startX, startY = self.findPiecesXY(piece)[0]
-            dx = 2 if moveText == "O-O" else -2
-            endX, endY = startX + dx, startY
-
-            if [endX, endY] in self.getCastlingMoves(startX, startY):
-                return startX, startY, endX, endY, None
-            else:
-                return self.getError(9)
+            return self.getError(9)
 
         # Text analysis
-        pattern = re.compile(
-            r"^([RNBQK]?)([a-h]?)([1-8]?)([x]?)([a-h][1-8])(=?[qrbnQRBN]?)$")
-        match = pattern.match(moveText)
+        match = SAN_PATTERN.match(moveText)
 
         # Check if the analysis failed
         if not match:
@@ -477,7 +932,7 @@ class ChessLogic:
 
         # Check if there is no capture to perform
         if capture and self.getPiece(endX, endY) == '.' \
-                and not self.enPassantTarget:
+                and self.enPassantSq < 0:
             return self.getError(10)
 
         # Check if no piece type is specified - it is about pawns (e.g. 'e4')
@@ -494,10 +949,7 @@ class ChessLogic:
             return self.getError(3)
 
         # Find possible piece positions
-        possiblePositions = [
-            (x, y) for x, y in piecePositions
-            if [endX, endY] in self.getLegalMoves(x, y)
-        ]
+        possiblePositions = self.findPiecesReaching(piece, endX, endY)
 
         # Check for unambiguous moves
         isUnambiguous, startX, startY = self.isMoveUnambiguous(
@@ -507,14 +959,30 @@ class ChessLogic:
 
         # Check for promotion piece
         if promotionPiece:
-            promotionPiece = promotionPiece[1].lower() \
+            promotionPiece = promotionPiece[-1].lower() \
                 if self.getPiece(startX, startY).islower() else \
-                promotionPiece[1].upper()
+                promotionPiece[-1].upper()
         else:
             promotionPiece = None
 
         return startX, startY, endX, endY, promotionPiece
 
+    def findPiecesReaching(self, piece: str,
+                           endX: int, endY: int) -> List[Tuple[int, int]]:
+        # Positions of the pieces of a given type with a legal move to the
+        # square (one move generation for all of them)
+        endSq = 8 * endY + endX
+        positions = []
+
+        for move in self.generateLegalMoves(piece.isupper()):
+            startX, startY = moveStart(move) % 8, moveStart(move) // 8
+            if moveEnd(move) == endSq \
+                    and self.getPiece(startX, startY) == piece \
+                    and (startX, startY) not in positions:
+                positions.append((startX, startY))
+
+        return positions
+
     @staticmethod
     def isMoveUnambiguous(piecePositions: Sequence[Tuple[int, int]],
                           file: str, rank: str) \
@@ -531,49 +999,280 @@ class ChessLogic:
         return len(unambiguousPositions) == 1, startPos[0], startPos[1]
 
     def coordsToSAN(self, startX, startY, newX, newY, promotionPiece=None):
-        piece = self.getPiece(startX, startY)
-        pieceType = piece.upper()
+        isLight = self.getPiece(startX, startY).isupper()
+        move = coordsToMove(startX, startY, newX, newY)
 
-        pieceLetter = '' if pieceType == 'P' else pieceType
-        capture = 'x' \
-            if self.getPiece(newX, newY) != '.' \
-            or self.enPassantPerformed else ''
-        file = chr(ord('a') + startX)
-        rank = str(8 - startY)
-        endSquare = chr(ord('a') + newX) + str(8 - newY)
+        sanMove = self.getSANTable(isLight)[1].get(move)
+        if sanMove is None:
+            # Not a legal move - notation without disambiguation
+            capture = self.getPiece(newX, newY) != '.'
+            sanMove = self.moveToSAN(
+                coordsToMove(startX, startY, newX, newY,
+                             CAPTURE if capture else QUIET), ())
 
-        if pieceType == 'K' and abs(newX - startX) == 2:
-            return 'O-O' if newX > startX else 'O-O-O'
+        if self.promotionPiece:
+            sanMove += '=' + self.promotionPiece.upper()
+
+        if promotionPiece:
+            sanMove += '=' + promotionPiece.upper()
+
+        return sanMove
+
+    def moveToSAN(self, move: int, origins: Sequence[int]) -> str:
+        # Move text without promotion piece and check marks. Origins are start
+        # squares of all pieces of the same type reaching the end square
+        startSq, endSq, flags = moveStart(move), moveEnd(move), moveFlags(move)
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            return 'O-O' if flags == KING_CASTLE else 'O-O-O'
+
+        pieceType = abs(self.board[startSq])
+        file, rank = SQUARE_NAMES[startSq]
+        capture = 'x' if flags & CAPTURE else ''
 
-        if pieceType == 'P':
-            sanMove = file + capture + endSquare if capture else endSquare
+        if pieceType == PAWN:
+            sanMove = file + capture + SQUARE_NAMES[endSq] if capture \
+                else SQUARE_NAMES[endSq]
         else:
-            possiblePositions = [(x, y) for x, y in self.findPiecesXY(piece)
-                                 if [newX, newY] in self.getLegalMoves(x, y)]
+            pieceLetter = PIECE_NAMES[pieceType]
 
-            if len(possiblePositions) > 1:  # Unambiguous moves
-                sameFilePositions = [pos for pos in possiblePositions
-                                     if pos[0] == startX]
-                sameRankPositions = [pos for pos in possiblePositions
-                                     if pos[1] == startY]
+            if len(origins) > 1:    # Unambiguous moves
+                sameFileCount = sum(1 for sq in origins
+                                    if sq % 8 == startSq % 8)
+                sameRankCount = sum(1 for sq in origins
+                                    if sq // 8 == startSq // 8)
 
-                if len(sameFilePositions) == 1:
+                if sameFileCount == 1:
                     pieceLetter += file
-                elif len(sameRankPositions) == 1:
+                elif sameRankCount == 1:
                     pieceLetter += rank
                 else:
                     pieceLetter += file
                     pieceLetter += rank
 
-            sanMove = pieceLetter + capture + endSquare
+            sanMove = pieceLetter + capture + SQUARE_NAMES[endSq]
 
-        if self.enPassantPerformed:
+        if flags == EN_PASSANT:
             sanMove += 'ep'
 
-        if self.promotionPiece:
-            sanMove += '=' + self.promotionPiece.upper()
+        return sanMove
 
-        if promotionPiece:
-            sanMove += '=' + promotionPiece.upper()
+    def iterSANVariants(self, move: int) -> Iterator[str]:
+        # All accepted texts of the move: with any disambiguation, with and
+        # without capture mark and promotion '='
+        startSq, endSq, flags = moveStart(move), moveEnd(move), moveFlags(move)
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            castling = 'O-O' if flags == KING_CASTLE else 'O-O-O'
+            yield castling
+            yield castling.replace('O', '0')
+            return
 
-        return sanMove
+        pieceType = abs(self.board[startSq])
+        pieceLetter = '' if pieceType == PAWN else PIECE_NAMES[pieceType]
+        file, rank = SQUARE_NAMES[startSq]
+        captures = ('', 'x') if flags & CAPTURE else ('',)
+
+        promotionPiece = movePromotionPiece(move)
+        suffixes = ('',) if promotionPiece is None else tuple(
+            sign + piece for sign in ('=', '')
+            for piece in (promotionPiece.upper(), promotionPiece))
+
+        for origin in ('', file, rank, file + rank):
+            for capture in captures:
+                for suffix in suffixes:
+                    yield pieceLetter + origin + capture \
+                        + SQUARE_NAMES[endSq] + suffix
+
+    def getSANTable(self, isLight: Optional[bool] = None) \
+            -> Tuple[Dict[str, int], Dict[int, str]]:
+        # Tables of the legal moves (text -> move and move -> text) built once
+        # per position and side
+        if isLight is None:
+            isLight = (self.activePlayer == "light")
+
+        key = self.getPositionHash("light" if isLight else "dark")
+        table = self.sanTableCache.get(key)
+        if table is None:
+            if len(self.sanTableCache) >= SAN_TABLE_CACHE_SIZE:
+                self.sanTableCache.clear()
+
+            table = self.buildSANTable(self.generateLegalMoves(isLight))
+            self.sanTableCache[key] = table
+
+        return table
+
+    def buildSANTable(self, moves: Sequence[int]) \
+            -> Tuple[Dict[str, int], Dict[int, str]]:
+        # Start squares of the pieces reaching each square (by piece type)
+        origins: Dict[Tuple[int, int], List[int]] = {}
+        for move in moves:
+            starts = origins.setdefault(
+                (self.board[moveStart(move)], moveEnd(move)), [])
+            if moveStart(move) not in starts:
+                starts.append(moveStart(move))
+
+        # Promotions to different pieces share the rendered text (the piece
+        # is added separately)
+        parseTable: Dict[str, int] = {}
+        renderTable: Dict[int, str] = {}
+        for move in moves:
+            startSq, endSq = moveStart(move), moveEnd(move)
+            renderTable[move & SQUARES_MASK] = self.moveToSAN(
+                move, origins[(self.board[startSq], endSq)])
+
+            # Text shared by several moves is ambiguous
+            for variant in self.iterSANVariants(move):
+                parseTable[variant] = move \
+                    if parseTable.get(variant, move) == move \
+                    else AMBIGUOUS_MOVE
+
+        return parseTable, renderTable
+
+    # ------------
+    # FEN notation
+    # ------------
+
+    @classmethod
+    def fromFEN(cls, fen: str = START_FEN) -> 'ChessLogic':
+        fields = fen.split()
+        if len(fields) not in (4, 6):
+            raise ValueError(f"Incorrect FEN: {fen}")
+
+        placement, side, castling, enPassant = fields[:4]
+        rows = placement.split('/')
+        if len(rows) != 8 or side not in ('w', 'b') \
+                or not (castling == '-' or set(castling) <= set('KQkq')):
+            raise ValueError(f"Incorrect FEN: {fen}")
+
+        logic = cls()
+
+        # Pieces (ranks from the 8th to the 1st)
+        for y, row in enumerate(rows):
+            x = 0
+            for char in row:
+                if char.isdigit():
+                    x += int(char)
+                elif char in PIECE_CODES and char != '.' and x < 8:
+                    logic.setPiece(x, y, char)
+                    x += 1
+                else:
+                    raise ValueError(f"Incorrect FEN: {fen}")
+
+            if x != 8:
+                raise ValueError(f"Incorrect FEN: {fen}")
+
+        # Move generation needs one king of each side and no pawns on the
+        # first and the last ranks
+        backRanks = logic.board[:8] + logic.board[56:]
+        if logic.board.count(KING) != 1 or logic.board.count(-KING) != 1 \
+                or PAWN in backRanks or -PAWN in backRanks:
+            raise ValueError(f"Incorrect FEN: {fen}")
+
+        logic.activePlayer = "light" if side == 'w' else "dark"
+
+        # Rights without the king or the rook on its initial square are lost
+        logic.castlingRights = sum(bit for letter, bit in FEN_CASTLING
+                                   if letter in castling)
+        for sq, code in CASTLING_PIECES:
+            if logic.board[sq] != code:
+                logic.castlingRights &= CASTLING_MASKS[sq]
+
+        # FEN gives the square behind the pawn, the logic keeps the pawn
+        if enPassant != '-':
+            if enPassant not in SQUARE_NAMES \
+                    or enPassant[1] != ('6' if side == 'w' else '3'):
+                raise ValueError(f"Incorrect FEN: {fen}")
+            logic.enPassantSq = SQUARE_NAMES.index(enPassant) \
+                + (8 if side == 'w' else -8)
+
+        if len(fields) == 6:
+            logic.halfmoveClock, logic.fullmoveNumber = \
+                int(fields[4]), int(fields[5])
+
+        return logic
+
+    def toFEN(self) -> str:
+        rows = []
+        for y in range(8):
+            row, emptyCount = '', 0
+            for code in self.board[8 * y:8 * y + 8]:
+                if code == EMPTY:
+                    emptyCount += 1
+                    continue
+
+                if emptyCount:
+                    row += str(emptyCount)
+                    emptyCount = 0
+                row += PIECE_NAMES[code]
+
+            rows.append(row + (str(emptyCount) if emptyCount else ''))
+
+        castling = ''.join(letter for letter, bit in FEN_CASTLING
+                           if self.castlingRights & bit) or '-'
+
+        # Square behind the pawn which has just made a double step
+        enPassant = '-'
+        if self.enPassantSq >= 0 and not self.enPassantPerformed:
+            enPassant = SQUARE_NAMES[
+                self.enPassantSq
+                + (8 if self.board[self.enPassantSq] > EMPTY else -8)]
+
+        return ' '.join(('/'.join(rows),
+                         'b' if self.activePlayer == "dark" else 'w',
+                         castling, enPassant, str(self.halfmoveClock),
+                         str(self.fullmoveNumber)))
+
+    # ----------
+    # Symmetries
+    # ----------
+
+    def getTransformedHash(self, transform: int) -> int:
+        # Position hash after the transform (logic/symmetry.py) without
+        # building the position (pieces are hashed incrementally)
+        squares = TRANSFORM_SQUARES[transform]
+        positionHash = ZOBRIST_CASTLING[
+            transformCastling(self.castlingRights, transform)] \
+            ^ (self.symmetricHash >> (HASH_CHUNK_BITS * transform)
+               & HASH_CHUNK_MASK)
+
+        if (self.activePlayer == "dark") != bool(transform & COLOUR_FLIP):
+            positionHash ^= ZOBRIST_DARK_TO_MOVE
+
+        if self.enPassantSq >= 0 and not self.enPassantPerformed:
+            positionHash ^= ZOBRIST_EN_PASSANT[squares[self.enPassantSq] % 8]
+
+        return positionHash
+
+    def getCanonicalHash(self) -> Tuple[int, int]:
+        # The smallest hash among the symmetric positions (all of them have
+        # the same result) and the transform leading to it
+        hasPawns = PAWN in self.board or -PAWN in self.board
+
+        return min((self.getTransformedHash(transform), transform)
+                   for transform in getValidTransforms(hasPawns,
+                                                       self.castlingRights))
+
+    def getTransformed(self, transform: int) -> 'ChessLogic':
+        squares = TRANSFORM_SQUARES[transform]
+        isFlipped = bool(transform & COLOUR_FLIP)
+        logic = ChessLogic()
+
+        for sq, code in enumerate(self.board):
+            if code != EMPTY:
+                logic.setCode(squares[sq], -code if isFlipped else code)
+
+        logic.activePlayer = self.activePlayer if not isFlipped \
+            else {"light": "dark", "dark": "light"}.get(self.activePlayer)
+        logic.castlingRights = transformCastling(self.castlingRights,
+                                                 transform)
+        if self.enPassantSq >= 0 and not self.enPassantPerformed:
+            logic.enPassantSq = squares[self.enPassantSq]
+        logic.halfmoveClock = self.halfmoveClock
+        logic.fullmoveNumber = self.fullmoveNumber
+
+        return logic
+
+    def getCanonicalForm(self) -> Tuple['ChessLogic', int]:
+        # Inverse transform (INVERSE_TRANSFORMS) maps the position back
+        _, transform = self.getCanonicalHash()
+
+        return self.getTransformed(transform), transform
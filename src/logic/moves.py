@@ -0,0 +1,101 @@
+from typing import List, Optional, Tuple
+
+# Packed 16-bit move: bits 0-5 - start square, bits 6-11 - end square,
+# bits 12-15 - flags. Square index is 8 * y + x (a8 = 0, h1 = 63)
+QUIET, DOUBLE_PUSH, KING_CASTLE, QUEEN_CASTLE, CAPTURE, EN_PASSANT = \
+    0, 1, 2, 3, 4, 5
+PROMOTION = 8   # Lowest two bits hold the piece, CAPTURE bit may be set too
+PROMOTION_PIECES: str = "nbrq"
+
+# Moves from and to a square, for masking the flags out
+SQUARES_MASK: int = 0xFFF
+
+# Castling rights bits (FEN order "KQkq")
+CASTLE_LIGHT_KING, CASTLE_LIGHT_QUEEN, CASTLE_DARK_KING, CASTLE_DARK_QUEEN = \
+    1, 2, 4, 8
+ALL_CASTLING_RIGHTS: int = 15
+
+# Targets of jumping pieces and rays of sliding pieces for every square
+# (directions: 4 orthogonal first, then 4 diagonal)
+KNIGHT_JUMPS: List[List[int]] = []
+KING_STEPS: List[List[int]] = []
+RAYS: List[List[List[int]]] = []
+
+for _sq in range(64):
+    _x, _y = _sq % 8, _sq // 8
+    KNIGHT_JUMPS.append([
+        8 * (_y + dy) + _x + dx
+        for dx, dy in ((1, 2), (2, 1), (-1, 2), (-2, 1),
+                       (1, -2), (2, -1), (-1, -2), (-2, -1))
+        if 0 <= _x + dx < 8 and 0 <= _y + dy < 8])
+    KING_STEPS.append([
+        8 * (_y + dy) + _x + dx
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1),
+                       (1, 1), (-1, 1), (1, -1), (-1, -1))
+        if 0 <= _x + dx < 8 and 0 <= _y + dy < 8])
+    RAYS.append([
+        [8 * (_y + i * dy) + _x + i * dx for i in range(1, 8)
+         if 0 <= _x + i * dx < 8 and 0 <= _y + i * dy < 8]
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1),
+                       (1, 1), (-1, 1), (1, -1), (-1, -1))])
+
+# Index of the ray from one square (in RAYS) passing through another square,
+# -1 if the squares are not on one line
+LINE_DIRECTIONS: List[List[int]] = [[-1] * 64 for _ in range(64)]
+for _sq in range(64):
+    for _ind, _ray in enumerate(RAYS[_sq]):
+        for _endSq in _ray:
+            LINE_DIRECTIONS[_sq][_endSq] = _ind
+
+
+def encodeMove(startSq: int, endSq: int, flags: int = QUIET) -> int:
+    return startSq | (endSq << 6) | (flags << 12)
+
+
+def coordsToMove(startX: int, startY: int, newX: int, newY: int,
+                 flags: int = QUIET) -> int:
+    return encodeMove(8 * startY + startX, 8 * newY + newX, flags)
+
+
+def moveStart(move: int) -> int:
+    return move & 0x3F
+
+
+def moveEnd(move: int) -> int:
+    return (move >> 6) & 0x3F
+
+
+def moveFlags(move: int) -> int:
+    return move >> 12
+
+
+def isCapture(move: int) -> bool:
+    return bool((move >> 12) & CAPTURE)
+
+
+def isPromotionMove(move: int) -> bool:
+    return bool((move >> 12) & PROMOTION)
+
+
+def isTacticalMove(move: int) -> bool:
+    # Captures and promotions (all other moves are quiet)
+    return bool((move >> 12) & (CAPTURE | PROMOTION))
+
+
+def promotionFlags(promotionPiece: str, capture: bool) -> int:
+    return PROMOTION | PROMOTION_PIECES.index(promotionPiece.lower()) \
+        | (CAPTURE if capture else 0)
+
+
+def movePromotionPiece(move: int) -> Optional[str]:
+    if not isPromotionMove(move):
+        return None
+
+    return PROMOTION_PIECES[(move >> 12) & 3]
+
+
+def moveToCoords(move: int) -> Tuple[int, int, int, int, Optional[str]]:
+    startSq, endSq = move & 0x3F, (move >> 6) & 0x3F
+
+    return startSq % 8, startSq // 8, endSq % 8, endSq // 8, \
+        movePromotionPiece(move)
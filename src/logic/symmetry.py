@@ -0,0 +1,69 @@
+from typing import List, Sequence
+
+from logic.moves import (
+    CASTLE_LIGHT_KING, CASTLE_LIGHT_QUEEN, CASTLE_DARK_KING, CASTLE_DARK_QUEEN,
+    encodeMove, moveStart, moveEnd, moveFlags)
+
+# Transform index: bit 0 - colour flip (ranks are mirrored and the colours
+# of pieces and the side to move are swapped), bits 1-3 - symmetry of the
+# square (0 - none, 1 - files mirrored, 2-7 - other reflections and
+# rotations, valid for pawnless positions only)
+COLOUR_FLIP: int = 1
+IDENTITY: int = 0
+TRANSFORMS_COUNT: int = 16
+
+# Square symmetries on (x, y)
+SQUARE_SYMMETRIES = (
+    lambda x, y: (x, y), lambda x, y: (7 - x, y),
+    lambda x, y: (x, 7 - y), lambda x, y: (7 - x, 7 - y),
+    lambda x, y: (y, x), lambda x, y: (7 - y, x),
+    lambda x, y: (y, 7 - x), lambda x, y: (7 - y, 7 - x)
+)
+
+# Target square of each square for each transform and inverse transforms
+TRANSFORM_SQUARES: List[List[int]] = []
+for _transform in range(TRANSFORMS_COUNT):
+    _squares = []
+    for _sq in range(64):
+        _flippedSq = _sq ^ 56 if _transform & COLOUR_FLIP else _sq
+        _x, _y = SQUARE_SYMMETRIES[_transform >> 1](_flippedSq % 8,
+                                                    _flippedSq // 8)
+        _squares.append(8 * _y + _x)
+    TRANSFORM_SQUARES.append(_squares)
+
+INVERSE_TRANSFORMS: List[int] = [
+    next(inverse for inverse in range(TRANSFORMS_COUNT)
+         if inverse & COLOUR_FLIP == transform & COLOUR_FLIP
+         and all(TRANSFORM_SQUARES[inverse][TRANSFORM_SQUARES[transform][sq]]
+                 == sq for sq in range(64)))
+    for transform in range(TRANSFORMS_COUNT)
+]
+
+
+def getValidTransforms(hasPawns: bool, castlingRights: int) -> Sequence[int]:
+    # Castling binds the king and the rooks to their files, pawns bind the
+    # position to the direction of their moves
+    if castlingRights:
+        return IDENTITY, COLOUR_FLIP
+    if hasPawns:
+        return range(4)
+
+    return range(TRANSFORMS_COUNT)
+
+
+def transformCastling(castlingRights: int, transform: int) -> int:
+    # Rights are kept only under the identity and the colour flip
+    if not transform & COLOUR_FLIP:
+        return castlingRights
+
+    return (CASTLE_DARK_KING if castlingRights & CASTLE_LIGHT_KING else 0) \
+        | (CASTLE_DARK_QUEEN if castlingRights & CASTLE_LIGHT_QUEEN else 0) \
+        | (CASTLE_LIGHT_KING if castlingRights & CASTLE_DARK_KING else 0) \
+        | (CASTLE_LIGHT_QUEEN if castlingRights & CASTLE_DARK_QUEEN else 0)
+
+
+def transformMove(move: int, transform: int) -> int:
+    squares = TRANSFORM_SQUARES[transform]
+
+    return encodeMove(squares[moveStart(move)], squares[moveEnd(move)],
+                      moveFlags(move))
@@ -1,15 +1,27 @@
-from typing import Optional, Any, TYPE_CHECKING
+from typing import Optional, Any, List, TYPE_CHECKING
 
-from PySide2.QtCore import (QObject, QDataStream, QTime)
+from PySide2.QtCore import (QObject, QTime, QTimer)
 from PySide2.QtNetwork import (QTcpSocket, QHostAddress)
 
 from net.chess_server import ServerThread
+from net.protocol import (
+    MSG_SET_NICK, MSG_START, MSG_SERVER_FULL, MSG_MOVE, MSG_CLOCKS, MSG_REJECT,
+    MSG_PING, MSG_PONG, MSG_FLAG, MSG_SNAPSHOT, MSG_UNKNOWN_GAME,
+    MessageDecoder, encodeMessage, encodeJoin, encodeResume,
+    decodeSetNick, decodeSide, decodeMove, decodeTimes, decodeSnapshot)
+from logic.moves import moveToCoords
 
 if TYPE_CHECKING:
     from qt_windows.main_window import MainWindow
 else:
     MainWindow = Any
 
+# Delay between attempts to get back into the game (ms)
+RECONNECT_DELAY: int = 1000
+
+# Rating sent to the lobby (players are not rated yet)
+DEFAULT_RATING: int = 1500
+
 
 class ChessClient(QObject):
     def __init__(self, ip: str, port: int, parent: MainWindow) -> None:
@@ -17,6 +29,12 @@ class ChessClient(QObject):
         self.mainWindow: MainWindow = parent
         self.serverThread: Optional[ServerThread] = None
         self.playerNick: Optional[str] = None
+        self.decoder = MessageDecoder()
+
+        # Session of the game (to resume it after the connection is lost)
+        # and moves made while offline
+        self.sessionToken: Optional[bytes] = None
+        self.outbox: List[bytes] = []
 
         # Initialize client socket
         self.socket = QTcpSocket()
@@ -31,6 +49,18 @@ class ChessClient(QObject):
 
     def connected(self) -> None:
         print("Connected to server!")
+        self.decoder = MessageDecoder()
+
+        if self.sessionToken is not None:
+            # Back to the game: the server answers with a snapshot
+            self.socket.write(encodeResume(self.sessionToken))
+        else:
+            # Join as a player with the chosen game time (no increment)
+            timeHour, timeMin, timeSec = \
+                self.mainWindow.startDialog.getGameTime()
+            self.sendData(encodeJoin(
+                1000 * (3600 * timeHour + 60 * timeMin + timeSec), 0,
+                DEFAULT_RATING))
         self.mainWindow.errorLabel.setText("Connected to server!")
         self.mainWindow.errorLabel.setStyleSheet("color:rgb(0, 170, 0)")
 
@@ -39,8 +69,19 @@ class ChessClient(QObject):
         self.mainWindow.errorLabel.setText("Disconnected from server...")
         self.mainWindow.errorLabel.setStyleSheet("color:rgb(227, 11, 92)")
 
+        if self.sessionToken is not None:
+            QTimer.singleShot(RECONNECT_DELAY, self.reconnect)
+
+    def reconnect(self) -> None:
+        print("Reconnecting...")
+        self.socket.connectToHost(self.ip, self.port)
+
     def errorOccurred(self, error: Any) -> None:
-        if error == QTcpSocket.ConnectionRefusedError:
+        if error == QTcpSocket.ConnectionRefusedError \
+                and self.sessionToken is not None:
+            # Server is not reachable yet, the game waits there
+            QTimer.singleShot(RECONNECT_DELAY, self.reconnect)
+        elif error == QTcpSocket.ConnectionRefusedError:
             print("The server is not running! Starting the server...")
             self.mainWindow.errorLabel.setText(
                 "The server is not running! Starting the server...")
@@ -55,15 +96,18 @@ class ChessClient(QObject):
             print(f"Error: {error}")
 
     def receiveData(self) -> None:
-        stream = QDataStream(self.socket)
-        stream.setVersion(QDataStream.Qt_5_0)
-
-        while self.socket.bytesAvailable() > 0:
-            data = stream.readQString()
+        try:
+            messages = self.decoder.feed(self.socket.readAll().data())
+        except ValueError as error:
+            print(f"Error: {error}")
+            self.socket.disconnectFromHost()
+            return
 
-            if data.startswith("set_nick:"):
-                self.playerNick = data.split(':')[1]
-                print(f"Your side: {self.playerNick}.")
+        for msgType, payload in messages:
+            if msgType == MSG_SET_NICK:
+                self.playerNick, gameId, self.sessionToken = \
+                    decodeSetNick(payload)
+                print(f"Your side: {self.playerNick} (game #{gameId}).")
 
                 if self.playerNick == "light":
                     self.mainWindow.errorLabel.setText(
@@ -71,47 +115,102 @@ class ChessClient(QObject):
                             Network: {self.ip.toString()}:{self.port}")
                     self.mainWindow.errorLabel.setStyleSheet(
                         "color:rgb(0, 170, 0)")
-            elif data == "server_full":
+            elif msgType == MSG_SERVER_FULL:
                 print("The server is full! Cannot join the game...")
                 self.socket.disconnectFromHost()
-            elif data == "start":
+            elif msgType == MSG_START:
                 print("Start!")
                 self.mainWindow.errorLabel.setText("Start!")
                 self.mainWindow.errorLabel.setStyleSheet(
                     "color:rgb(0, 170, 0)")
 
-                self.mainWindow.setClocks()
+                baseTime, _ = decodeTimes(payload)
+                time = QTime.fromMSecsSinceStartOfDay(baseTime)
+                self.mainWindow.setClocks(
+                    (time.hour(), time.minute(), time.second()))
                 self.mainWindow.board.logic.activePlayer = "light"
                 self.mainWindow.netActivePlayer = "light"
-            elif data.startswith("time:"):
-                time = map(int, data.split(":")[1:])
-
-                if self.playerNick == "light":
-                    self.mainWindow.clock2.leftTime = QTime(*time)
-                    self.mainWindow.clock2.update()
-                elif self.playerNick == "dark":
-                    self.mainWindow.clock1.leftTime = QTime(*time)
-                    self.mainWindow.clock1.update()
-            else:
-                # Perform move
-                startX, startY, newX, newY = map(int, data[:4])
-                promotionPiece = data[4] if len(data) > 4 else None
-                sanMove = self.mainWindow.board.logic.coordsToSAN(
-                    startX, startY, newX, newY, promotionPiece)
-                self.mainWindow.board.textMove(sanMove)
-                print(f"Received: {data} ({sanMove})")
-
-                # Change active player and set clocks
-                player = self.mainWindow.board.logic.activePlayer
-                self.mainWindow.board.changeActivePlayer(player)
-                self.mainWindow.netActivePlayer = "light" \
-                    if self.mainWindow.netActivePlayer == "dark" else "dark"
-
-                self.mainWindow.errorLabel.setText("Your turn!")
+            elif msgType == MSG_CLOCKS:
+                # Clocks of the server are authoritative
+                lightTime, darkTime = decodeTimes(payload)
+                self.mainWindow.clock1.setLeftTime(lightTime)
+                self.mainWindow.clock2.setLeftTime(darkTime)
+            elif msgType == MSG_PING:
+                self.sendData(encodeMessage(MSG_PONG, payload))
+            elif msgType == MSG_FLAG:
+                playerNick = decodeSide(payload)
+                print(f"Time is over for the {playerNick} player!")
+
+                board = self.mainWindow.board
+                if board.logic.activePlayer is not None:
+                    board.logic.activePlayer = "dark" \
+                        if playerNick == "light" else "light"
+                    board.gameOver()
+            elif msgType == MSG_REJECT:
+                print(f"The server rejected the move {decodeMove(payload)}!")
+                self.mainWindow.errorLabel.setText(
+                    "The server rejected your move!")
                 self.mainWindow.errorLabel.setStyleSheet(
-                    "color:rgb(0, 170, 0)")
+                    "color:rgb(227, 11, 92)")
+            elif msgType == MSG_MOVE:
+                self.performMove(decodeMove(payload))
+            elif msgType == MSG_SNAPSHOT:
+                # Moves made by the opponent while this client was offline
+                lightTime, darkTime, _, moves = decodeSnapshot(payload)
+                board = self.mainWindow.board
+
+                # Move rejected by the server is taken back: the position is
+                # rebuilt from the accepted moves (moves waiting in the
+                # outbox are not sent yet)
+                isRebuilt = len(board.logic.moveHistory) > len(moves) \
+                    and not self.outbox
+                if isRebuilt:
+                    board.resetPosition()
+                    self.mainWindow.netActivePlayer = "light"
+
+                for move in moves[len(board.logic.moveHistory):]:
+                    self.performMove(move)
+
+                # Clock of the side to move runs again
+                if isRebuilt and board.logic.activePlayer is not None:
+                    board.changeClocks("dark" if board.logic.activePlayer
+                                       == "light" else "light")
+
+                self.mainWindow.clock1.setLeftTime(lightTime)
+                self.mainWindow.clock2.setLeftTime(darkTime)
+
+                # Moves made while offline are sent now
+                for data in self.outbox:
+                    self.socket.write(data)
+                self.outbox.clear()
+            elif msgType == MSG_UNKNOWN_GAME:
+                print("The game is over! Cannot get back into it...")
+                self.sessionToken = None
+                self.outbox.clear()
+                self.socket.disconnectFromHost()
+
+    def performMove(self, move: int) -> None:
+        # Perform move (packed 16-bit move)
+        startX, startY, newX, newY, promotionPiece = moveToCoords(move)
+        sanMove = self.mainWindow.board.logic.coordsToSAN(
+            startX, startY, newX, newY, promotionPiece)
+        self.mainWindow.board.textMove(sanMove)
+        print(f"Received: {move} ({sanMove})")
+
+        # Change active player and set clocks
+        player = self.mainWindow.board.logic.activePlayer
+        self.mainWindow.board.changeActivePlayer(player)
+        self.mainWindow.netActivePlayer = "light" \
+            if self.mainWindow.netActivePlayer == "dark" else "dark"
+
+        self.mainWindow.errorLabel.setText("Your turn!")
+        self.mainWindow.errorLabel.setStyleSheet("color:rgb(0, 170, 0)")
 
-    def sendData(self, data: str) -> None:
-        stream = QDataStream(self.socket)
-        stream.setVersion(QDataStream.Qt_5_0)
-        stream.writeQString(data)
+    def sendData(self, data: bytes) -> None:
+        # Encoded message (see net.protocol); kept until the game is resumed
+        # when the connection is lost
+        if self.socket.state() != QTcpSocket.ConnectedState \
+                and self.sessionToken is not None:
+            self.outbox.append(data)
+        else:
+            self.socket.write(data)
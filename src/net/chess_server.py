@@ -1,8 +1,15 @@
 import sys
-from typing import Optional, Any, List
+import time
+import struct
+from typing import Optional, Any, Dict
 
-from PySide2.QtCore import (QObject, QDataStream, QThread)
-from PySide2.QtNetwork import (QTcpServer, QHostAddress)
+from PySide2.QtCore import (QObject, QThread, QTimer)
+from PySide2.QtNetwork import (QTcpServer, QTcpSocket, QHostAddress)
+
+from net.game_room import GameRoom
+from net.protocol import (
+    MAX_CLIENT_PAYLOAD_SIZE, MSG_SERVER_FULL, MSG_JOIN, MSG_WATCH, MSG_RESUME,
+    MSG_UNKNOWN_GAME, MessageDecoder, encodeMessage, decodeJoin)
 
 
 class ChessServer(QObject):
@@ -22,65 +29,93 @@ class ChessServer(QObject):
         else:
             print(f"Server running on {self.ip.toString()}:{self.port}.")
 
-        # Players (clients) info
-        self.playerSocket: List[Optional[QTcpServer]] = [None, None]
-        self.playerNick: List[Optional[str]] = [None, None]
+        # Game (position, clocks, players and spectators); connections are
+        # known by their decoders, the first message tells the role
+        self.room = GameRoom(1, self.scheduleFlag)
+        self.decoders: Dict[QTcpSocket, MessageDecoder] = {}
+        self.playerInds: Dict[QTcpSocket, Optional[int]] = {}
+
+        # Flag check of the running clock
+        self.flagTimer = QTimer()
+        self.flagTimer.setSingleShot(True)
+        self.flagTimer.timeout.connect(
+            lambda: self.room.checkFlag(time.monotonic()))
 
     def newConnection(self) -> None:
-        if None not in self.playerSocket:
+        # Initialize new socket
+        newSocket = self.server.nextPendingConnection()
+        newSocket.readyRead.connect(lambda: self.receiveData(newSocket))
+        newSocket.disconnected.connect(
+            lambda: self.socketDisconnected(newSocket))
+        self.decoders[newSocket] = MessageDecoder(MAX_CLIENT_PAYLOAD_SIZE)
+
+    def socketDisconnected(self, socket: QTcpSocket) -> None:
+        self.decoders.pop(socket, None)
+        socket.deleteLater()
+        if socket not in self.playerInds:
+            return
+
+        playerInd = self.playerInds.pop(socket)
+        if playerInd is None:
+            self.room.removeSpectator(socket)
+            return
+
+        print(f"Player ({self.room.playerNick[playerInd]}) is "
+              f"disconnected...")
+        self.room.removePlayer(playerInd)
+
+    def receiveData(self, socket: QTcpSocket) -> None:
+        now = time.monotonic()
+        try:
+            for msgType, payload in self.decoders[socket].feed(
+                    socket.readAll().data()):
+                if socket not in self.playerInds:
+                    self.joinRoom(socket, msgType, payload, now)
+                elif self.playerInds[socket] is not None:
+                    self.room.receiveMessage(self.playerInds[socket],
+                                             msgType, payload, now)
+        except (ValueError, struct.error) as error:
+            print(f"Error: {error}")
+            socket.disconnectFromHost()
+
+    def joinRoom(self, socket: QTcpSocket, msgType: int, payload: bytes,
+                 now: float) -> None:
+        if msgType == MSG_WATCH:
+            # There is a single game: any game id is accepted
+            self.playerInds[socket] = None
+            self.room.addSpectator(socket, socket.bytesToWrite, now)
+            print("Spectator joined the game!")
+            return
+
+        if msgType == MSG_RESUME:
+            playerInd = self.room.resumePlayer(socket, payload, now)
+            if playerInd is None:
+                socket.write(encodeMessage(MSG_UNKNOWN_GAME))
+                socket.disconnectFromHost()
+                return
+
+            self.playerInds[socket] = playerInd
+            print(f"Player ({self.room.playerNick[playerInd]}) is back!")
+            return
+
+        if msgType != MSG_JOIN or self.room.isFull():
             print("There are already two players! Rejecting connection...")
-            newSocket = self.server.nextPendingConnection()
-            stream = QDataStream(newSocket)
-            stream.setVersion(QDataStream.Qt_5_0)
-            stream.writeQString("server_full")
-            newSocket.disconnectFromHost()
+            socket.write(encodeMessage(MSG_SERVER_FULL))
+            socket.disconnectFromHost()
             return
 
-        playerInd = 0 if self.playerSocket[0] is None else 1
+        # There is no lobby: players meet in the single game
+        baseTime, increment, _ = decodeJoin(payload)
+        playerInd = self.room.addPlayer(socket, (baseTime, increment), now)
+        self.playerInds[socket] = playerInd
+        print(f"Player ({self.room.playerNick[playerInd]}) joined the game!")
 
-        # Initialize new socket
-        newSocket = self.server.nextPendingConnection()
-        newSocket.readyRead.connect(
-            lambda: self.receiveData(playerInd))
-        newSocket.disconnected.connect(
-            lambda: self.playerDisconnected(playerInd))
-
-        # Refresh info about players (sockets and nicknames)
-        self.playerSocket[playerInd] = newSocket
-        playerNick = 'light' if playerInd == 0 else 'dark'
-        self.playerNick[playerInd] = playerNick
-        self.sendData(playerInd, f"set_nick:{playerNick}")
-        print(f"Player ({playerNick}) joined the game!")
-
-        # Check if two players are connected
-        if None not in self.playerSocket:
-            self.sendData(playerInd, "start")
-            self.sendData(1 - playerInd, "start")
-
-    def playerDisconnected(self, playerInd: int) -> None:
-        print(f"Player ({self.playerNick[playerInd]}) is disconnected...")
-
-        self.playerSocket[playerInd].deleteLater()
-        self.playerSocket[playerInd] = None
-        self.playerNick[playerInd] = None
-
-    def receiveData(self, playerInd: int) -> None:
-        socket = self.playerSocket[playerInd]
-        stream = QDataStream(socket)
-        stream.setVersion(QDataStream.Qt_5_0)
-
-        while socket.bytesAvailable() > 0:
-            data = stream.readQString()
-
-            otherPlayerInd = 1 - playerInd
-            self.sendData(otherPlayerInd, data)
-
-    def sendData(self, playerInd: int, data: str) -> None:
-        socket = self.playerSocket[playerInd]
-        if socket is not None:
-            stream = QDataStream(socket)
-            stream.setVersion(QDataStream.Qt_5_0)
-            stream.writeQString(data)
+    def scheduleFlag(self, room: GameRoom, deadline: Optional[float]) -> None:
+        if deadline is None:
+            self.flagTimer.stop()
+        else:
+            self.flagTimer.start(
+                max(int(1000 * (deadline - time.monotonic())) + 1, 0))
 
 
 class ServerThread(QThread):
@@ -0,0 +1,75 @@
+from typing import List, Optional
+
+# Transit time credited for a single move is capped (seconds), so a client
+# cannot gain time by faking a slow connection
+MAX_LAG_COMPENSATION: float = 0.5
+
+# Weight of a new round-trip sample in the smoothed value
+ROUND_TRIP_SMOOTHING: float = 0.25
+
+
+class GameClock:
+    # Server clocks of both players; times are in milliseconds, moments come
+    # from time.monotonic() (seconds)
+    def __init__(self, baseTime: int, increment: int = 0) -> None:
+        self.timeLeft: List[int] = [baseTime, baseTime]
+        self.increment: int = increment
+
+        # Player whose clock is running and the start of the turn
+        self.activeInd: Optional[int] = None
+        self.turnStart: float = 0.0
+
+        # Smoothed round-trip time of each player (seconds)
+        self.roundTrip: List[float] = [0.0, 0.0]
+
+    def start(self, now: float) -> None:
+        self.activeInd = 0
+        self.turnStart = now
+
+    def stop(self, now: float) -> None:
+        if self.activeInd is not None:
+            self.timeLeft[self.activeInd] = \
+                self.getTimeLeft(self.activeInd, now)
+            self.activeInd = None
+
+    def isRunning(self) -> bool:
+        return self.activeInd is not None
+
+    def recordRoundTrip(self, playerInd: int, roundTrip: float) -> None:
+        if self.roundTrip[playerInd] == 0.0:
+            self.roundTrip[playerInd] = roundTrip
+        else:
+            self.roundTrip[playerInd] += \
+                ROUND_TRIP_SMOOTHING * (roundTrip - self.roundTrip[playerInd])
+
+    def getLagCompensation(self, playerInd: int) -> float:
+        # The opponent's move travels to the player and the answer travels
+        # back: a whole round trip is not the player's thinking time
+        return min(self.roundTrip[playerInd], MAX_LAG_COMPENSATION)
+
+    def getTimeLeft(self, playerInd: int, now: float) -> int:
+        if playerInd != self.activeInd:
+            return self.timeLeft[playerInd]
+
+        elapsed = now - self.turnStart - self.getLagCompensation(playerInd)
+
+        return max(self.timeLeft[playerInd] - max(int(1000 * elapsed), 0), 0)
+
+    def getDeadline(self) -> Optional[float]:
+        # Moment of the flag fall of the active player
+        if self.activeInd is None:
+            return None
+
+        return self.turnStart + self.timeLeft[self.activeInd] / 1000 \
+            + self.getLagCompensation(self.activeInd)
+
+    def isFlagged(self, now: float) -> bool:
+        return self.activeInd is not None and now >= self.getDeadline()
+
+    def switch(self, now: float) -> None:
+        # Charge the move to the active player and start the opponent's turn
+        playerInd = self.activeInd
+        self.timeLeft[playerInd] = \
+            self.getTimeLeft(playerInd, now) + self.increment
+        self.activeInd = 1 - playerInd
+        self.turnStart = now
@@ -0,0 +1,283 @@
+import time
+import secrets
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from net.game_clock import GameClock
+from net.game_state import GameState
+from net.server_stats import ServerStats
+from net.protocol import (
+    PLAYER_NICKS, TOKEN_SIZE, GAME_PAYLOAD, MSG_MOVE, MSG_PING,
+    MSG_PONG, encodeSetNick,
+    encodeFlag, encodeReject, encodeMove, encodeClocks, encodeStart,
+    encodeStamp, encodeSnapshot, encodePosition, decodeMove, decodeStamp)
+
+# Called with the room and the moment (time.monotonic()) when the flag of
+# the active player may fall, None when the clocks are stopped
+FlagScheduler = Callable[['GameRoom', Optional[float]], None]
+
+# Bytes waiting to be sent to a spectator before new messages are dropped
+# (the spectator gets a snapshot once the backlog is sent)
+SPECTATOR_BACKLOG_LIMIT: int = 1 << 16
+
+
+class Spectator:
+    # Writer and the function returning the number of bytes not sent yet
+    def __init__(self, writer: Any, getBacklog: Callable[[], int]) -> None:
+        self.writer: Any = writer
+        self.getBacklog: Callable[[], int] = getBacklog
+        self.isStale: bool = False
+
+    def send(self, data: bytes, room: 'GameRoom', now: float,
+             resultData: Optional[bytes] = None) -> None:
+        # A slow reader never holds up the game: messages are dropped until
+        # it catches up, then a snapshot replaces all of them. Messages
+        # ending the game (with the result data, the part of them missing
+        # in the snapshot) are never dropped
+        if self.getBacklog() > SPECTATOR_BACKLOG_LIMIT and resultData is None:
+            self.isStale = True
+            return
+
+        if self.isStale:
+            self.isStale = False
+            data = room.getSnapshot(now) + (resultData or b'')
+
+        self.writer.write(data)
+
+
+class GameRoom:
+    # One game hosted by a server; players are any objects with the write()
+    # method (asyncio.StreamWriter, QTcpSocket)
+    def __init__(self, gameId: int, scheduleFlag: FlagScheduler,
+                 stats: Optional[ServerStats] = None) -> None:
+        self.gameId: int = gameId
+        self.scheduleFlag: FlagScheduler = scheduleFlag
+        self.stats: Optional[ServerStats] = stats
+
+        # Players (clients) info: light side first. A player who lost the
+        # connection keeps the slot (and the session token) until the game
+        # is over, the clock keeps running
+        self.playerWriter: List[Optional[Any]] = [None, None]
+        self.playerNick: List[Optional[str]] = [None, None]
+        self.playerToken: List[Optional[bytes]] = [None, None]
+
+        # Position and clocks kept by the server (the time control is chosen
+        # by the light player)
+        self.game: GameState = GameState()
+        self.timeControl: Optional[Tuple[int, int]] = None
+        self.clock: Optional[GameClock] = None
+
+        # Spectators by writer and the position part of the snapshot (built
+        # once per move, shared by all spectators)
+        self.spectators: Dict[Any, Spectator] = {}
+        self.position: Optional[bytes] = None
+
+    def isFull(self) -> bool:
+        return None not in self.playerNick
+
+    def isEmpty(self) -> bool:
+        return self.playerNick == [None, None]
+
+    def isPlaying(self) -> bool:
+        return self.clock is not None and self.clock.isRunning()
+
+    def addPlayer(self, writer: Any, timeControl: Tuple[int, int],
+                  now: float) -> int:
+        playerInd = 0 if self.playerNick[0] is None else 1
+        self.playerWriter[playerInd] = writer
+        self.playerNick[playerInd] = PLAYER_NICKS[playerInd]
+        self.playerToken[playerInd] = GAME_PAYLOAD.pack(self.gameId) \
+            + secrets.token_bytes(TOKEN_SIZE - GAME_PAYLOAD.size)
+        if playerInd == 0:
+            self.timeControl = timeControl
+
+        self.sendData(playerInd, encodeSetNick(self.playerNick[playerInd],
+                                               self.gameId,
+                                               self.playerToken[playerInd]))
+        self.tryStart(now)
+
+        return playerInd
+
+    def resumePlayer(self, writer: Any, token: bytes,
+                     now: float) -> Optional[int]:
+        # The player gets the whole state in a single snapshot
+        for playerInd in range(2):
+            if self.playerWriter[playerInd] is None \
+                    and self.playerToken[playerInd] is not None \
+                    and secrets.compare_digest(self.playerToken[playerInd],
+                                               token):
+                self.playerWriter[playerInd] = writer
+                self.sendData(playerInd,
+                              encodeSetNick(self.playerNick[playerInd],
+                                            self.gameId, token)
+                              + self.getSnapshot(now)
+                              + encodeStamp(MSG_PING, int(1000 * now)))
+                return playerInd
+
+        return None
+
+    def removePlayer(self, playerInd: int) -> None:
+        self.playerWriter[playerInd] = None
+        if not self.isPlaying():
+            self.releasePlayer(playerInd)
+
+    def releasePlayer(self, playerInd: int) -> None:
+        self.playerWriter[playerInd] = None
+        self.playerNick[playerInd] = None
+        self.playerToken[playerInd] = None
+
+    def releaseDisconnected(self) -> None:
+        # Slots kept for reconnection are freed when the game is over
+        for playerInd in range(2):
+            if self.playerWriter[playerInd] is None:
+                self.releasePlayer(playerInd)
+
+    def sendData(self, playerInd: int, data: bytes) -> None:
+        # Writes are buffered by the transport, nobody waits for them
+        writer = self.playerWriter[playerInd]
+        if writer is not None:
+            writer.write(data)
+
+    def broadcast(self, data: bytes, now: float,
+                  resultData: Optional[bytes] = None) -> None:
+        self.sendData(0, data)
+        self.sendData(1, data)
+        self.sendSpectators(data, now, resultData)
+
+    # ----------
+    # Spectators
+    # ----------
+
+    def addSpectator(self, writer: Any, getBacklog: Callable[[], int],
+                     now: float) -> None:
+        self.spectators[writer] = Spectator(writer, getBacklog)
+        writer.write(self.getSnapshot(now))
+
+    def removeSpectator(self, writer: Any) -> None:
+        self.spectators.pop(writer, None)
+
+    def sendSpectators(self, data: bytes, now: float,
+                       resultData: Optional[bytes] = None) -> None:
+        # The same encoded buffer goes to every spectator
+        for spectator in self.spectators.values():
+            spectator.send(data, self, now, resultData)
+
+    def getClockTimes(self, now: float) -> Tuple[int, int]:
+        if self.clock is not None:
+            return self.clock.getTimeLeft(0, now), \
+                self.clock.getTimeLeft(1, now)
+        if self.timeControl is not None:
+            return self.timeControl[0], self.timeControl[0]
+
+        return 0, 0
+
+    def getSnapshot(self, now: float) -> bytes:
+        if self.position is None:
+            self.position = encodePosition(self.game.logic.toFEN(),
+                                           self.game.moves)
+
+        return encodeSnapshot(*self.getClockTimes(now), self.position)
+
+    # --------
+    # Messages
+    # --------
+
+    def receiveMessage(self, playerInd: int, msgType: int, payload: bytes,
+                       now: float) -> None:
+        if msgType == MSG_MOVE:
+            self.receiveMove(playerInd, decodeMove(payload), now)
+        elif msgType == MSG_PONG:
+            if self.clock is not None and self.clock.isRunning():
+                self.clock.recordRoundTrip(
+                    playerInd, self.getRoundTrip(decodeStamp(payload), now))
+
+    def receiveMove(self, playerInd: int, move: int, now: float) -> None:
+        # Flag may fall before the timer fires
+        if self.checkFlag(now):
+            return
+
+        # Only accepted moves reach the opponent; the player gets the
+        # position back to take the move back
+        if self.clock is None or not self.clock.isRunning() \
+                or not self.validateMove(playerInd, move):
+            print(f"Player ({self.playerNick[playerInd]}) sent an illegal "
+                  f"move {move} in the game #{self.gameId}!")
+            self.sendData(playerInd,
+                          self.getSnapshot(now) + encodeReject(move))
+            return
+
+        self.clock.switch(now)
+        self.position = None
+
+        # Encoded once for all receivers
+        moveData = encodeMove(move)
+        clocksData = encodeClocks(*self.getClockTimes(now))
+        pingData = encodeStamp(MSG_PING, int(1000 * now))
+        self.sendData(1 - playerInd, moveData + clocksData + pingData)
+        self.sendData(playerInd, clocksData + pingData)
+        # The snapshot of a stale spectator holds the last move, which is
+        # enough to see the end of the game
+        self.sendSpectators(moveData + clocksData, now,
+                            b'' if self.game.result is not None else None)
+
+        if self.game.result is not None:
+            print(f"Game #{self.gameId} is over: {self.game.result}.")
+            self.stopClock(now)
+            self.releaseDisconnected()
+        else:
+            self.scheduleFlag(self, self.clock.getDeadline())
+
+    def validateMove(self, playerInd: int, move: int) -> bool:
+        if self.stats is None:
+            return self.game.applyMove(playerInd, move)
+
+        startTime = time.perf_counter()
+        isAccepted = self.game.applyMove(playerInd, move)
+        self.stats.validation.record(time.perf_counter() - startTime)
+
+        return isAccepted
+
+    # ------
+    # Clocks
+    # ------
+
+    def tryStart(self, now: float) -> None:
+        # Game starts when both players are connected and the time control
+        # is known
+        if not self.isFull() or self.timeControl is None:
+            return
+
+        self.game.reset()
+        self.position = None
+        self.clock = GameClock(*self.timeControl)
+        self.clock.start(now)
+        self.broadcast(encodeStart(*self.timeControl)
+                       + encodeClocks(*self.getClockTimes(now)), now)
+        self.sendData(0, encodeStamp(MSG_PING, int(1000 * now)))
+        self.sendData(1, encodeStamp(MSG_PING, int(1000 * now)))
+        self.scheduleFlag(self, self.clock.getDeadline())
+
+    def stopClock(self, now: float) -> None:
+        if self.clock is not None and self.clock.isRunning():
+            self.clock.stop(now)
+            self.scheduleFlag(self, None)
+
+    @staticmethod
+    def getRoundTrip(stamp: int, now: float) -> float:
+        # Stamps are milliseconds wrapped to 32 bits
+        return ((int(1000 * now) - stamp) & 0xFFFFFFFF) / 1000
+
+    def checkFlag(self, now: float) -> bool:
+        if self.clock is None or not self.clock.isFlagged(now):
+            return False
+
+        playerNick = PLAYER_NICKS[self.clock.activeInd]
+        print(f"Time is over for the {playerNick} player in the game "
+              f"#{self.gameId}!")
+        self.game.result = "timeout"
+        flagData = encodeFlag(playerNick)
+        self.broadcast(encodeClocks(*self.getClockTimes(now)) + flagData, now,
+                       flagData)
+        self.stopClock(now)
+        self.releaseDisconnected()
+
+        return True
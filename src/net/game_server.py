@@ -0,0 +1,305 @@
+import os
+import time
+import struct
+import asyncio
+import functools
+import itertools
+from typing import Dict, Optional
+
+from net.game_room import GameRoom
+from net.lobby import Lobby, TimeControl
+from net.server_stats import ServerStats
+from net.timer_wheel import TimerWheel
+from net.protocol import (
+    MAX_CLIENT_PAYLOAD_SIZE, MSG_SERVER_FULL, MSG_JOIN, MSG_WATCH, MSG_RESUME,
+    MSG_UNKNOWN_GAME, MessageDecoder, encodeMessage, decodeJoin, decodeGameId)
+
+# Limit of games hosted at once
+MAX_GAMES: int = 10000
+
+# Maximum number of bytes taken from a socket at once
+READ_SIZE: int = 1 << 16
+
+# Stats are served on the loopback interface only; requests are read with
+# a timeout (seconds)
+STATS_IP: str = '127.0.0.1'
+STATS_REQUEST_TIMEOUT: float = 1.0
+
+
+class Connection:
+    # Client waiting in the lobby, then a player or a spectator of a room
+    # (rooms write to the connection, so sent bytes are counted)
+    def __init__(self, writer: asyncio.StreamWriter,
+                 stats: ServerStats) -> None:
+        self.writer: asyncio.StreamWriter = writer
+        self.stats: ServerStats = stats
+        self.isWaiting: bool = False
+        self.room: Optional[GameRoom] = None
+        self.playerInd: Optional[int] = None
+
+    def write(self, data: bytes) -> None:
+        self.stats.bytesOut += len(data)
+        self.writer.write(data)
+
+    def getBacklog(self) -> int:
+        return self.writer.transport.get_write_buffer_size()
+
+
+class GameServer:
+    def __init__(self, ip: str, port: int, maxGames: int = MAX_GAMES,
+                 statsPort: Optional[int] = None,
+                 statsFile: Optional[str] = None,
+                 statsInterval: float = 10.0) -> None:
+        self.ip, self.port = ip, port
+        self.maxGames: int = maxGames
+        self.server: Optional[asyncio.AbstractServer] = None
+
+        # Runtime stats, served as text and/or written to a file
+        self.stats: ServerStats = ServerStats(time.monotonic())
+        self.statsPort: Optional[int] = statsPort
+        self.statsFile: Optional[str] = statsFile
+        self.statsInterval: float = statsInterval
+        self.statsServer: Optional[asyncio.AbstractServer] = None
+        self.statsTask: Optional[asyncio.Task] = None
+
+        # Rooms by game id; players meet in the lobby
+        self.rooms: Dict[int, GameRoom] = {}
+        self.lobby: Lobby = Lobby()
+        self.gameIds = itertools.count(1)
+
+        # Flag checks of all games (by game id) and widening of the lobby
+        # search of waiting players (by connection), driven by a single task
+        self.flagTimers: TimerWheel = TimerWheel(time.monotonic())
+        self.tickTask: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.handleConnection,
+                                                 self.ip, self.port)
+        self.tickTask = asyncio.ensure_future(self.runTimers())
+        self.statsTask = asyncio.ensure_future(self.runStats())
+        if self.statsPort is not None:
+            self.statsServer = await asyncio.start_server(
+                self.sendStats, STATS_IP, self.statsPort)
+        print(f"Server running on {self.ip}:{self.port}.")
+
+    async def serveForever(self) -> None:
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    # -----
+    # Rooms
+    # -----
+
+    def startGame(self, lightConn: Connection, darkConn: Connection,
+                  timeControl: TimeControl, now: float) -> None:
+        # The player waiting longer gets the light pieces
+        room = GameRoom(next(self.gameIds), self.scheduleFlag, self.stats)
+        self.rooms[room.gameId] = room
+
+        for conn in (lightConn, darkConn):
+            if conn.isWaiting:
+                self.flagTimers.cancel(conn)
+            conn.isWaiting = False
+            conn.room = room
+            conn.playerInd = room.addPlayer(conn, timeControl, now)
+        print(f"Game #{room.gameId} is started!")
+
+    def updateRoom(self, room: GameRoom) -> None:
+        if room.isEmpty():
+            self.rooms.pop(room.gameId, None)
+
+    # -----
+    # Lobby
+    # -----
+
+    def scheduleWidening(self, conn: Connection, now: float) -> None:
+        self.flagTimers.schedule(conn, self.lobby.getWidenTime(conn, now),
+                                 functools.partial(self.widenSearch, conn))
+
+    def widenSearch(self, conn: Connection) -> None:
+        # Searches widen in the order of arrival, so the player whose search
+        # found an opponent is usually the one waiting longer (light pieces)
+        now = time.monotonic()
+        timeControl = self.lobby.locations[conn][0]
+        opponent = self.lobby.widen(conn, now)
+        if opponent is None:
+            self.scheduleWidening(conn, now)
+        else:
+            self.startGame(conn, opponent, timeControl, now)
+
+    # ------
+    # Clocks
+    # ------
+
+    def scheduleFlag(self, room: GameRoom, deadline: Optional[float]) -> None:
+        # Only the deadline of the active player is registered
+        if deadline is None:
+            self.flagTimers.cancel(room.gameId)
+        else:
+            self.flagTimers.schedule(room.gameId, deadline,
+                                     functools.partial(self.checkFlag, room))
+
+    def checkFlag(self, room: GameRoom) -> None:
+        # Rounding of ticks may wake the room a moment too early
+        if room.checkFlag(time.monotonic()):
+            self.updateRoom(room)
+        elif room.isPlaying():
+            self.scheduleFlag(room, room.clock.getDeadline())
+
+    async def runTimers(self) -> None:
+        # The tick also measures how late the event loop wakes it up
+        while True:
+            startTime = time.monotonic()
+            await asyncio.sleep(self.flagTimers.tickSize)
+            now = time.monotonic()
+            self.stats.recordLoopLag(
+                max(now - startTime - self.flagTimers.tickSize, 0.0))
+            self.flagTimers.advance(now)
+
+    # -----
+    # Stats
+    # -----
+
+    def getStatsText(self, now: float) -> str:
+        return self.stats.format(now, {
+            'games': len(self.rooms),
+            'games_playing': sum(room.isPlaying()
+                                 for room in self.rooms.values()),
+            'lobby_players': len(self.lobby),
+            'spectators': sum(len(room.spectators)
+                              for room in self.rooms.values())})
+
+    async def runStats(self) -> None:
+        # Rates are sampled every second, the file is replaced atomically
+        lastDump = time.monotonic()
+        while True:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            self.stats.takeSample(now)
+
+            if self.statsFile is not None \
+                    and now - lastDump >= self.statsInterval:
+                lastDump = now
+                try:
+                    with open(self.statsFile + '.tmp', 'w') as file:
+                        file.write(self.getStatsText(now))
+                    os.replace(self.statsFile + '.tmp', self.statsFile)
+                except OSError as error:
+                    print(f"Error: {error}")
+
+    async def sendStats(self, reader: asyncio.StreamReader,
+                        writer: asyncio.StreamWriter) -> None:
+        # Answers a plain HTTP request with the stats text (other clients get
+        # it after the timeout)
+        try:
+            await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                                   STATS_REQUEST_TIMEOUT)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError,
+                asyncio.LimitOverrunError):
+            pass
+
+        body = self.getStatsText(time.monotonic()).encode()
+        writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\n'
+                     + f'Content-Length: {len(body)}\r\n\r\n'.encode()
+                     + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    # -----------
+    # Connections
+    # -----------
+
+    async def handleConnection(self, reader: asyncio.StreamReader,
+                               writer: asyncio.StreamWriter) -> None:
+        # First message tells a player from a spectator
+        decoder = MessageDecoder(MAX_CLIENT_PAYLOAD_SIZE)
+        conn = Connection(writer, self.stats)
+        self.stats.connections += 1
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+
+                now = time.monotonic()
+                self.stats.bytesIn += len(data)
+                for msgType, payload in decoder.feed(data):
+                    self.stats.messagesIn += 1
+                    startTime = time.perf_counter()
+                    if conn.room is not None:
+                        if conn.playerInd is not None:
+                            conn.room.receiveMessage(conn.playerInd, msgType,
+                                                     payload, now)
+                            self.updateRoom(conn.room)
+                    elif not conn.isWaiting \
+                            and not self.join(conn, msgType, payload, now):
+                        return
+                    self.stats.recordHandling(
+                        msgType, time.perf_counter() - startTime)
+        except ConnectionError:
+            pass
+        except (ValueError, struct.error) as error:
+            print(f"Error: {error}")
+        finally:
+            self.stats.connections -= 1
+            self.leave(conn)
+            writer.close()
+
+    def join(self, conn: Connection, msgType: int, payload: bytes,
+             now: float) -> bool:
+        if msgType == MSG_WATCH or msgType == MSG_RESUME:
+            room = self.rooms.get(decodeGameId(payload))
+            playerInd = None
+            if room is not None and msgType == MSG_RESUME:
+                playerInd = room.resumePlayer(conn, payload, now)
+
+            if room is None or (msgType == MSG_RESUME and playerInd is None):
+                conn.write(encodeMessage(MSG_UNKNOWN_GAME))
+                return False
+
+            if playerInd is None:
+                room.addSpectator(conn, conn.getBacklog, now)
+            else:
+                print(f"Player ({room.playerNick[playerInd]}) is back in the "
+                      f"game #{room.gameId}!")
+            conn.room, conn.playerInd = room, playerInd
+            return True
+
+        if msgType != MSG_JOIN or len(self.rooms) >= self.maxGames:
+            print("All games are busy! Rejecting connection...")
+            conn.write(encodeMessage(MSG_SERVER_FULL))
+            return False
+
+        # Wait in the lobby unless an opponent is already there
+        baseTime, increment, rating = decodeJoin(payload)
+        opponent = self.lobby.join(conn, (baseTime, increment), rating, now)
+        if opponent is None:
+            conn.isWaiting = True
+            self.scheduleWidening(conn, now)
+        else:
+            self.startGame(opponent, conn, (baseTime, increment), now)
+
+        return True
+
+    def leave(self, conn: Connection) -> None:
+        if conn.isWaiting:
+            self.lobby.leave(conn)
+            self.flagTimers.cancel(conn)
+            return
+
+        room, playerInd = conn.room, conn.playerInd
+        if room is None:
+            return
+
+        if playerInd is None:
+            room.removeSpectator(conn)
+            return
+
+        print(f"Player ({room.playerNick[playerInd]}) is disconnected from "
+              f"the game #{room.gameId}...")
+        room.removePlayer(playerInd)
+        self.updateRoom(room)
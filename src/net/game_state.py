@@ -0,0 +1,62 @@
+from array import array
+from typing import Dict, FrozenSet, Optional
+
+from logic.chess_logic import ChessLogic
+from net.protocol import PLAYER_NICKS
+
+# Legal moves by position hash, shared by all games of the process (most
+# games go through the same openings)
+LEGAL_MOVES_CACHE_SIZE: int = 1 << 16
+legalMovesCache: Dict[int, FrozenSet[int]] = {}
+
+
+class GameState:
+    # Authoritative copy of a networked game kept by the server
+    def __init__(self) -> None:
+        self.logic: ChessLogic = ChessLogic.fromFEN()
+        self.moves: array = array('H')
+        self.result: Optional[str] = None
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def getLegalMoves(self) -> FrozenSet[int]:
+        key = self.logic.getPositionHash()
+        moves = legalMovesCache.get(key)
+        if moves is None:
+            if len(legalMovesCache) >= LEGAL_MOVES_CACHE_SIZE:
+                legalMovesCache.clear()
+
+            moves = frozenset(self.logic.computeLegalMoves(
+                self.logic.activePlayer == "light"))
+            legalMovesCache[key] = moves
+
+        return moves
+
+    def isPlayerTurn(self, playerInd: int) -> bool:
+        return PLAYER_NICKS[playerInd] == self.logic.activePlayer
+
+    def applyMove(self, playerInd: int, move: int) -> bool:
+        # Out of turn and illegal moves are rejected
+        if self.result is not None or not self.isPlayerTurn(playerInd) \
+                or move not in self.getLegalMoves():
+            return False
+
+        self.logic.makeMove(move)
+        self.moves.append(move)
+        self.result = self.getStatus()
+
+        return True
+
+    def getStatus(self) -> Optional[str]:
+        # Same rules as ChessLogic.gameStatus, with the shared legal moves
+        if self.logic.isInsufficientMaterial():
+            return "insufficient material"
+        if self.logic.isThreefoldRepetition():
+            return "threefold repetition"
+        if self.logic.isFiftyMoveRule():
+            return "fifty-move rule"
+        if self.getLegalMoves():
+            return None
+
+        return "checkmate" if self.logic.check else "stalemate"
@@ -0,0 +1,315 @@
+import os
+import re
+import math
+import time
+import random
+import asyncio
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from logic.chess_logic import SAN_SUFFIX_PATTERN, AMBIGUOUS_MOVE
+from net.game_state import GameState
+from net.protocol import (
+    PLAYER_NICKS, MSG_SET_NICK, MSG_START, MSG_MOVE, MSG_PING, MSG_PONG,
+    MSG_FLAG, MSG_REJECT, MSG_SERVER_FULL, MessageDecoder, encodeMessage,
+    encodeJoin, encodeMove, decodeSetNick)
+
+# Move numbers and results in scripted games
+SCRIPT_NOISE_PATTERN = re.compile(r'^(\d+\.+|1-0|0-1|1/2-1/2|\*)$')
+
+# Maximum number of bytes taken from a socket at once
+READ_SIZE: int = 1 << 16
+
+ThinkTime = Callable[[], float]
+
+
+def parseThinkTime(text: str) -> ThinkTime:
+    # 'const:S', 'uniform:A:B', 'exp:MEAN' or 'lognormal:MU:SIGMA' (seconds)
+    kind, *args = text.split(':')
+    values = [float(arg) for arg in args]
+
+    if kind == 'const' and len(values) == 1:
+        return lambda: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(*values)
+    if kind == 'exp' and len(values) == 1:
+        return lambda: random.expovariate(1 / values[0])
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda: random.lognormvariate(*values)
+
+    raise ValueError(f"Incorrect think time distribution: {text}")
+
+
+def loadScripts(path: str) -> List[List[int]]:
+    # One game per line in SAN, converted to packed moves once
+    scripts = []
+    with open(path) as file:
+        for line in file:
+            state = GameState()
+            for token in line.split():
+                if SCRIPT_NOISE_PATTERN.match(token):
+                    continue
+
+                move = state.logic.getSANTable()[0].get(
+                    SAN_SUFFIX_PATTERN.sub('', token), AMBIGUOUS_MOVE)
+                if move == AMBIGUOUS_MOVE:
+                    raise ValueError(f"Incorrect move {token} in {path}")
+                state.applyMove(len(state.moves) % 2, move)
+
+            if state.moves:
+                scripts.append(list(state.moves))
+
+    return scripts
+
+
+def getPercentile(values: Sequence[float], percent: float) -> float:
+    # Nearest-rank percentile of sorted values
+    if not values:
+        return 0.0
+
+    return values[max(math.ceil(percent / 100 * len(values)) - 1, 0)]
+
+
+class ProcessMonitor:
+    # CPU and memory usage of a process read from /proc (Linux)
+    def __init__(self, pid: int) -> None:
+        self.pid: int = pid
+        self.ticksPerSecond: int = os.sysconf('SC_CLK_TCK')
+        self.lastCpuTime: float = self.getCpuTime()
+        self.lastTime: float = time.monotonic()
+
+    def getCpuTime(self) -> float:
+        try:
+            with open(f'/proc/{self.pid}/stat') as file:
+                # Fields after the command name (it may contain spaces)
+                fields = file.read().rsplit(')', 1)[1].split()
+        except OSError:
+            return 0.0
+
+        # User and system time
+        return (int(fields[11]) + int(fields[12])) / self.ticksPerSecond
+
+    def getCpuUsage(self) -> float:
+        # Percent of one core since the previous call
+        cpuTime, now = self.getCpuTime(), time.monotonic()
+        usage = 100 * (cpuTime - self.lastCpuTime) \
+            / max(now - self.lastTime, 1e-9)
+        self.lastCpuTime, self.lastTime = cpuTime, now
+
+        return usage
+
+    def getMemoryUsage(self) -> float:
+        # Resident set size in MiB
+        try:
+            with open(f'/proc/{self.pid}/status') as file:
+                for line in file:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+
+        return 0.0
+
+
+class SimulatedGame:
+    # State shared by both simulated players of a game (they run in the same
+    # process): the position and the moment the last move was sent
+    def __init__(self, script: Optional[List[int]]) -> None:
+        self.state: GameState = GameState()
+        self.script: Optional[List[int]] = script
+        self.sentAt: float = 0.0
+
+    def isScriptOver(self) -> bool:
+        return self.script is not None \
+            and len(self.state.moves) >= len(self.script)
+
+    def chooseMove(self) -> Optional[int]:
+        if self.script is not None:
+            return self.script[len(self.state.moves)]
+
+        moves = self.state.getLegalMoves()
+        return random.choice(tuple(moves)) if moves else None
+
+
+class LoadTest:
+    def __init__(self, ip: str, port: int, clientsCount: int,
+                 duration: float, thinkTime: ThinkTime,
+                 timeControl: Tuple[int, int] = (300000, 0),
+                 ratingSpread: int = 0, rampUp: float = 0.0,
+                 scripts: Optional[List[List[int]]] = None,
+                 maxPlies: int = 0, interval: float = 1.0,
+                 serverPid: Optional[int] = None) -> None:
+        self.ip, self.port = ip, port
+        self.clientsCount: int = clientsCount
+        self.duration: float = duration
+        self.thinkTime: ThinkTime = thinkTime
+        self.timeControl: Tuple[int, int] = timeControl
+        self.ratingSpread: int = ratingSpread
+        self.rampUp: float = rampUp
+        self.scripts: Optional[List[List[int]]] = scripts
+        self.maxPlies: int = maxPlies
+        self.interval: float = interval
+        self.monitor: Optional[ProcessMonitor] = \
+            ProcessMonitor(serverPid) if serverPid is not None else None
+
+        # Games in progress by game id
+        self.games: Dict[int, SimulatedGame] = {}
+        self.deadline: float = 0.0
+
+        # Statistics: relay latencies (seconds) of the current report and of
+        # the whole run, counters
+        self.windowLatencies: List[float] = []
+        self.latencies: array = array('d')
+        self.connected: int = 0
+        self.movesRelayed: int = 0
+        self.gamesFinished: int = 0
+        self.rejectedMoves: int = 0
+        self.errors: int = 0
+
+    async def run(self) -> None:
+        self.deadline = time.monotonic() + self.duration
+        reporter = asyncio.ensure_future(self.report())
+
+        clients = []
+        for clientInd in range(self.clientsCount):
+            clients.append(asyncio.ensure_future(self.runClient()))
+            if self.rampUp:
+                await asyncio.sleep(self.rampUp / self.clientsCount)
+
+        await asyncio.gather(*clients)
+        reporter.cancel()
+        self.printSummary()
+
+    # -------
+    # Clients
+    # -------
+
+    async def runClient(self) -> None:
+        # Plays games one after another until the end of the test
+        while time.monotonic() < self.deadline:
+            try:
+                await self.playGame()
+            except (ConnectionError, OSError):
+                self.errors += 1
+                await asyncio.sleep(1)
+
+    async def playGame(self) -> None:
+        reader, writer = await asyncio.open_connection(self.ip, self.port)
+        self.connected += 1
+        rating = 1500 + random.randint(-self.ratingSpread, self.ratingSpread)
+        writer.write(encodeJoin(*self.timeControl, rating))
+
+        decoder = MessageDecoder()
+        game, gameId, playerInd = None, None, None
+        try:
+            while time.monotonic() < self.deadline:
+                timeLeft = self.deadline - time.monotonic()
+                try:
+                    data = await asyncio.wait_for(reader.read(READ_SIZE),
+                                                  timeLeft)
+                except asyncio.TimeoutError:
+                    break
+                if not data:
+                    break
+
+                for msgType, payload in decoder.feed(data):
+                    if msgType == MSG_SET_NICK:
+                        playerNick, gameId, _ = decodeSetNick(payload)
+                        playerInd = PLAYER_NICKS.index(playerNick)
+                        game = self.games.get(gameId)
+                        if game is None:
+                            script = random.choice(self.scripts) \
+                                if self.scripts else None
+                            game = self.games[gameId] = SimulatedGame(script)
+                    elif msgType == MSG_START and playerInd == 0:
+                        self.scheduleMove(writer, game, playerInd)
+                    elif msgType == MSG_MOVE:
+                        latency = time.perf_counter() - game.sentAt
+                        self.windowLatencies.append(latency)
+                        self.latencies.append(latency)
+                        self.movesRelayed += 1
+                        if self.isGameOver(game):
+                            return
+                        self.scheduleMove(writer, game, playerInd)
+                    elif msgType == MSG_PING:
+                        writer.write(encodeMessage(MSG_PONG, payload))
+                    elif msgType == MSG_REJECT:
+                        self.rejectedMoves += 1
+                    elif msgType == MSG_FLAG:
+                        return
+                    elif msgType == MSG_SERVER_FULL:
+                        self.errors += 1
+                        await asyncio.sleep(1)
+                        return
+        finally:
+            self.connected -= 1
+            if self.games.pop(gameId, None) is not None:
+                self.gamesFinished += 1
+            writer.close()
+
+    def isGameOver(self, game: SimulatedGame) -> bool:
+        return game.state.result is not None or game.isScriptOver() \
+            or 0 < self.maxPlies <= len(game.state.moves)
+
+    def scheduleMove(self, writer: asyncio.StreamWriter, game: SimulatedGame,
+                     playerInd: int) -> None:
+        asyncio.get_running_loop().call_later(
+            max(self.thinkTime(), 0), self.sendMove, writer, game, playerInd)
+
+    def sendMove(self, writer: asyncio.StreamWriter, game: SimulatedGame,
+                 playerInd: int) -> None:
+        if writer.is_closing():
+            return
+
+        # Game ends with the last move of the script or the limit of plies
+        move = game.chooseMove()
+        if move is None or not game.state.applyMove(playerInd, move):
+            writer.close()
+            return
+
+        game.sentAt = time.perf_counter()
+        writer.write(encodeMove(move))
+        if self.isGameOver(game):
+            writer.close()
+
+    # ---------
+    # Reporting
+    # ---------
+
+    async def report(self) -> None:
+        startTime = time.monotonic()
+        lastMoves = 0
+
+        print("time   clients  games  moves/s  p50 ms  p90 ms  p99 ms  "
+              "max ms  cpu %  rss MiB")
+        while True:
+            await asyncio.sleep(self.interval)
+
+            latencies = sorted(self.windowLatencies)
+            self.windowLatencies = []
+            movesRate = (self.movesRelayed - lastMoves) / self.interval
+            lastMoves = self.movesRelayed
+
+            cpuUsage, memoryUsage = (self.monitor.getCpuUsage(),
+                                     self.monitor.getMemoryUsage()) \
+                if self.monitor is not None else (0.0, 0.0)
+            print(f"{time.monotonic() - startTime:5.0f}  "
+                  f"{self.connected:7d}  {len(self.games):5d}  "
+                  f"{movesRate:7.0f}  "
+                  f"{1000 * getPercentile(latencies, 50):6.1f}  "
+                  f"{1000 * getPercentile(latencies, 90):6.1f}  "
+                  f"{1000 * getPercentile(latencies, 99):6.1f}  "
+                  f"{1000 * (latencies[-1] if latencies else 0):6.1f}  "
+                  f"{cpuUsage:5.1f}  {memoryUsage:7.1f}")
+
+    def printSummary(self) -> None:
+        latencies = sorted(self.latencies)
+
+        print(f"Moves relayed: {self.movesRelayed} "
+              f"({self.movesRelayed / self.duration:.0f}/s), games finished: "
+              f"{self.gamesFinished}, rejected moves: {self.rejectedMoves}, "
+              f"errors: {self.errors}")
+        print("Relay latency (ms): " + ", ".join(
+            f"p{percent} {1000 * getPercentile(latencies, percent):.2f}"
+            for percent in (50, 90, 99, 99.9)) +
+            f", max {1000 * (latencies[-1] if latencies else 0):.2f}")
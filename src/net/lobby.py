@@ -0,0 +1,98 @@
+from typing import Dict, Hashable, Optional, Tuple
+
+# Players are paired within their rating band or the nearest ones; the
+# search is widened by one band per interval of waiting (seconds)
+RATING_BAND_WIDTH: int = 100
+MAX_BAND_DISTANCE: int = 2
+BAND_WIDENING_INTERVAL: float = 10.0
+
+TimeControl = Tuple[int, int]  # base time and increment (ms)
+Location = Tuple[TimeControl, int, float]  # time control, band, join time
+
+
+class Lobby:
+    # Waiting players by time control and rating band; each band keeps the
+    # order of arrival, so pairing looks at a few bands whatever the number
+    # of waiting players
+    def __init__(self) -> None:
+        self.queues: Dict[TimeControl, Dict[int, Dict[Hashable, None]]] = {}
+        self.locations: Dict[Hashable, Location] = {}
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def join(self, player: Hashable, timeControl: TimeControl, rating: int,
+             now: float) -> Optional[Hashable]:
+        # Returns the opponent (taken from the lobby) or None when the player
+        # has to wait
+        bands = self.queues.setdefault(timeControl, {})
+        band = rating // RATING_BAND_WIDTH
+
+        opponent = self.findOpponent(player, bands, band, MAX_BAND_DISTANCE)
+        if opponent is not None:
+            self.leave(opponent)
+            return opponent
+
+        bands.setdefault(band, {})[player] = None
+        self.locations[player] = (timeControl, band, now)
+
+        return None
+
+    def widen(self, player: Hashable, now: float) -> Optional[Hashable]:
+        # Searches again for a waiting player with the distance allowed by
+        # the time spent in the lobby; both players leave it when paired
+        location = self.locations.get(player)
+        if location is None:
+            return None
+
+        timeControl, band, joinTime = location
+        distance = MAX_BAND_DISTANCE \
+            + int((now - joinTime) / BAND_WIDENING_INTERVAL)
+        opponent = self.findOpponent(player, self.queues[timeControl], band,
+                                     distance)
+        if opponent is not None:
+            self.leave(player)
+            self.leave(opponent)
+
+        return opponent
+
+    def getWidenTime(self, player: Hashable, now: float) -> float:
+        # Moment the allowed distance of a waiting player grows next
+        joinTime = self.locations[player][2]
+        intervals = int((now - joinTime) / BAND_WIDENING_INTERVAL) + 1
+
+        return joinTime + intervals * BAND_WIDENING_INTERVAL
+
+    @staticmethod
+    def findOpponent(player: Hashable, bands: Dict[int, Dict[Hashable, None]],
+                     band: int, maxDistance: int) -> Optional[Hashable]:
+        # Nearest band first (the lower one of two at the same distance);
+        # the distance never exceeds the farthest band with someone waiting
+        if not bands:
+            return None
+
+        maxDistance = min(maxDistance,
+                          max(abs(otherBand - band) for otherBand in bands))
+        for distance in range(maxDistance + 1):
+            candidateBands = (band,) if distance == 0 \
+                else (band - distance, band + distance)
+            for candidateBand in candidateBands:
+                for opponent in bands.get(candidateBand, ()):
+                    if opponent is not player:
+                        return opponent
+
+        return None
+
+    def leave(self, player: Hashable) -> None:
+        location = self.locations.pop(player, None)
+        if location is None:
+            return
+
+        # Empty bands and queues are dropped
+        timeControl, band, _ = location
+        bands = self.queues[timeControl]
+        del bands[band][player]
+        if not bands[band]:
+            del bands[band]
+            if not bands:
+                del self.queues[timeControl]
@@ -0,0 +1,190 @@
+import struct
+from typing import List, Sequence, Tuple
+
+# Frame: header (payload length, protocol version, message type) followed by
+# the payload, all big-endian
+PROTOCOL_VERSION: int = 5
+HEADER = struct.Struct('>HBB')
+MAX_PAYLOAD_SIZE: int = 0xFFFF
+
+# Message types
+MSG_SET_NICK: int = 1  # side of the player (byte), game id, session token
+MSG_START: int = 2  # time control
+MSG_SERVER_FULL: int = 3
+MSG_MOVE: int = 4  # packed 16-bit move
+MSG_CLOCKS: int = 5  # time left on the light and dark clocks
+MSG_REJECT: int = 6  # packed move refused by the server (after a snapshot)
+MSG_JOIN: int = 7  # first message of a player: time control and rating
+MSG_PING: int = 8  # server time stamp, returned in MSG_PONG
+MSG_PONG: int = 9
+MSG_FLAG: int = 10  # side whose time is over (byte)
+MSG_WATCH: int = 11  # first message of a spectator: game id
+MSG_SNAPSHOT: int = 12  # clocks, position (FEN) and packed moves
+MSG_UNKNOWN_GAME: int = 13
+MSG_RESUME: int = 14  # first message of a reconnecting player: token
+MESSAGE_TYPES: range = range(MSG_SET_NICK, MSG_RESUME + 1)
+
+# Clients send short messages only, so servers refuse longer frames before
+# buffering them
+MAX_CLIENT_PAYLOAD_SIZE: int = 64
+
+PLAYER_NICKS: Tuple[str, str] = ('light', 'dark')
+
+# Times are in milliseconds
+MOVE_PAYLOAD = struct.Struct('>H')
+TIME_PAYLOAD = struct.Struct('>II')
+JOIN_PAYLOAD = struct.Struct('>IIH')
+STAMP_PAYLOAD = struct.Struct('>I')
+SIDE_PAYLOAD = struct.Struct('>B')
+GAME_PAYLOAD = struct.Struct('>I')
+
+# Session token: game id followed by a random secret
+TOKEN_SIZE: int = 16
+NICK_PAYLOAD = struct.Struct(f'>BI{TOKEN_SIZE}s')
+FEN_LENGTH = struct.Struct('>H')
+SNAPSHOT_HEADER = struct.Struct('>IIH')  # clocks and FEN length
+
+Message = Tuple[int, bytes]
+
+
+def encodeMessage(msgType: int, payload: bytes = b'') -> bytes:
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise ValueError(f"Payload is too long ({len(payload)} bytes)")
+
+    return HEADER.pack(len(payload), PROTOCOL_VERSION, msgType) + payload
+
+
+def encodeSetNick(playerNick: str, gameId: int, token: bytes) -> bytes:
+    return encodeMessage(MSG_SET_NICK, NICK_PAYLOAD.pack(
+        PLAYER_NICKS.index(playerNick), gameId, token))
+
+
+def encodeFlag(playerNick: str) -> bytes:
+    return encodeMessage(MSG_FLAG,
+                         SIDE_PAYLOAD.pack(PLAYER_NICKS.index(playerNick)))
+
+
+def encodeMove(move: int) -> bytes:
+    return encodeMessage(MSG_MOVE, MOVE_PAYLOAD.pack(move))
+
+
+def encodeReject(move: int) -> bytes:
+    return encodeMessage(MSG_REJECT, MOVE_PAYLOAD.pack(move))
+
+
+def encodeStart(baseTime: int, increment: int) -> bytes:
+    return encodeMessage(MSG_START, TIME_PAYLOAD.pack(baseTime, increment))
+
+
+def encodeJoin(baseTime: int, increment: int, rating: int) -> bytes:
+    return encodeMessage(MSG_JOIN,
+                         JOIN_PAYLOAD.pack(baseTime, increment, rating))
+
+
+def encodeClocks(lightTime: int, darkTime: int) -> bytes:
+    return encodeMessage(MSG_CLOCKS, TIME_PAYLOAD.pack(lightTime, darkTime))
+
+
+def encodeStamp(msgType: int, stamp: int) -> bytes:
+    # MSG_PING and MSG_PONG
+    return encodeMessage(msgType, STAMP_PAYLOAD.pack(stamp & 0xFFFFFFFF))
+
+
+def encodeWatch(gameId: int) -> bytes:
+    return encodeMessage(MSG_WATCH, GAME_PAYLOAD.pack(gameId))
+
+
+def encodeResume(token: bytes) -> bytes:
+    return encodeMessage(MSG_RESUME, token)
+
+
+def encodeSnapshot(lightTime: int, darkTime: int, position: bytes) -> bytes:
+    # Position part comes from encodePosition (it changes only with moves)
+    return encodeMessage(MSG_SNAPSHOT,
+                         TIME_PAYLOAD.pack(lightTime, darkTime) + position)
+
+
+def encodePosition(fen: str, moves: Sequence[int]) -> bytes:
+    data = fen.encode('ascii')
+
+    return FEN_LENGTH.pack(len(data)) + data \
+        + struct.pack(f'>{len(moves)}H', *moves)
+
+
+def decodeSetNick(payload: bytes) -> Tuple[str, int, bytes]:
+    sideInd, gameId, token = NICK_PAYLOAD.unpack(payload)
+
+    return PLAYER_NICKS[sideInd], gameId, token
+
+
+def decodeSide(payload: bytes) -> str:
+    return PLAYER_NICKS[SIDE_PAYLOAD.unpack(payload)[0]]
+
+
+def decodeGameId(payload: bytes) -> int:
+    # MSG_WATCH and MSG_RESUME (session token starts with the game id)
+    return GAME_PAYLOAD.unpack_from(payload)[0]
+
+
+def decodeSnapshot(payload: bytes) -> Tuple[int, int, str, List[int]]:
+    # Clocks, FEN and moves
+    lightTime, darkTime, fenLength = SNAPSHOT_HEADER.unpack_from(payload)
+    movesStart = SNAPSHOT_HEADER.size + fenLength
+    fen = payload[SNAPSHOT_HEADER.size:movesStart].decode('ascii')
+    moves = struct.unpack(f'>{(len(payload) - movesStart) // 2}H',
+                          payload[movesStart:])
+
+    return lightTime, darkTime, fen, list(moves)
+
+
+def decodeMove(payload: bytes) -> int:
+    return MOVE_PAYLOAD.unpack(payload)[0]
+
+
+def decodeTimes(payload: bytes) -> Tuple[int, int]:
+    # MSG_START and MSG_CLOCKS
+    return TIME_PAYLOAD.unpack(payload)
+
+
+def decodeJoin(payload: bytes) -> Tuple[int, int, int]:
+    # Base time, increment and rating
+    return JOIN_PAYLOAD.unpack(payload)
+
+
+def decodeStamp(payload: bytes) -> int:
+    return STAMP_PAYLOAD.unpack(payload)[0]
+
+
+class MessageDecoder:
+    # Incremental decoder: bytes are fed as they arrive from the socket and
+    # complete frames are returned (the rest waits for more data); headers
+    # are checked as soon as they arrive
+    def __init__(self, maxPayloadSize: int = MAX_PAYLOAD_SIZE) -> None:
+        self.buffer = bytearray()
+        self.maxPayloadSize: int = maxPayloadSize
+
+    def feed(self, data: bytes) -> List[Message]:
+        self.buffer += data
+        messages = []
+
+        offset = 0
+        while len(self.buffer) - offset >= HEADER.size:
+            length, version, msgType = HEADER.unpack_from(self.buffer, offset)
+            if version != PROTOCOL_VERSION:
+                raise ValueError(f"Unsupported protocol version {version}")
+            if msgType not in MESSAGE_TYPES:
+                raise ValueError(f"Unknown message type {msgType}")
+            if length > self.maxPayloadSize:
+                raise ValueError(f"Payload is too long ({length} bytes)")
+
+            end = offset + HEADER.size + length
+            if len(self.buffer) < end:
+                break
+
+            messages.append((msgType,
+                             bytes(self.buffer[offset + HEADER.size:end])))
+            offset = end
+
+        del self.buffer[:offset]
+
+        return messages
@@ -0,0 +1,136 @@
+import bisect
+from collections import deque
+from typing import Deque, Dict, List, Tuple
+
+from net import protocol
+
+# Upper bounds of histogram buckets (seconds): 1 us to about a minute, each
+# bucket is sqrt(2) times wider than the previous one
+HISTOGRAM_BOUNDS: List[float] = [1e-6 * 2 ** (ind / 2) for ind in range(52)]
+
+# Rates are averaged over this many seconds (one sample per second)
+RATE_WINDOW: int = 10
+
+QUANTILES: Tuple[float, ...] = (0.5, 0.9, 0.99, 0.999)
+
+MESSAGE_NAMES: Dict[int, str] = {
+    value: name[4:].lower() for name, value in vars(protocol).items()
+    if name.startswith('MSG_')}
+
+Counters = Tuple[float, int, int, int]  # moment, messages, bytes in and out
+
+
+class Histogram:
+    # Durations in logarithmic buckets: recording is a binary search over
+    # a fixed list, quantiles are accurate within a bucket
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.maximum: float = 0.0
+
+    def record(self, value: float) -> None:
+        self.counts[bisect.bisect_left(HISTOGRAM_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.maximum:
+            self.maximum = value
+
+    def getQuantile(self, quantile: float) -> float:
+        # Upper bound of the bucket holding the quantile, never above the
+        # maximum
+        rank = quantile * self.count
+        seen = 0
+        for ind, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and seen:
+                return min(HISTOGRAM_BOUNDS[ind], self.maximum) \
+                    if ind < len(HISTOGRAM_BOUNDS) else self.maximum
+
+        return 0.0
+
+    def format(self, name: str, labels: str = '') -> List[str]:
+        separator = ',' if labels else ''
+        lines = [f'{name}{{{labels}{separator}quantile="{quantile}"}} '
+                 f'{self.getQuantile(quantile):.6f}'
+                 for quantile in QUANTILES]
+        labels = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_max{labels} {self.maximum:.6f}')
+        lines.append(f'{name}_sum{labels} {self.total:.6f}')
+        lines.append(f'{name}_count{labels} {self.count}')
+
+        return lines
+
+
+class ServerStats:
+    # Counters and histograms of a server, reported as plain text lines
+    # ("name{labels} value", durations in seconds)
+    def __init__(self, now: float) -> None:
+        self.startTime: float = now
+        self.connections: int = 0
+        self.messagesIn: int = 0
+        self.bytesIn: int = 0
+        self.bytesOut: int = 0
+
+        # Handling time by message type, move validation and the delay of
+        # the event loop behind its schedule
+        self.handling: Dict[int, Histogram] = {}
+        self.validation: Histogram = Histogram()
+        self.loopLag: Histogram = Histogram()
+        self.recentLoopLag: float = 0.0
+        self.lastLoopLag: float = 0.0
+
+        self.samples: Deque[Counters] = deque(maxlen=RATE_WINDOW + 1)
+        self.takeSample(now)
+
+    def recordHandling(self, msgType: int, duration: float) -> None:
+        histogram = self.handling.get(msgType)
+        if histogram is None:
+            histogram = self.handling[msgType] = Histogram()
+        histogram.record(duration)
+
+    def recordLoopLag(self, lag: float) -> None:
+        self.loopLag.record(lag)
+        if lag > self.recentLoopLag:
+            self.recentLoopLag = lag
+
+    def takeSample(self, now: float) -> None:
+        # Called every second; the worst lag of the last second is kept
+        self.samples.append((now, self.messagesIn, self.bytesIn,
+                             self.bytesOut))
+        self.lastLoopLag, self.recentLoopLag = self.recentLoopLag, 0.0
+
+    def getRates(self) -> Tuple[float, float, float]:
+        # Messages and bytes in and out per second over the window
+        (startTime, *startCounts), (endTime, *endCounts) = \
+            self.samples[0], self.samples[-1]
+        duration = endTime - startTime
+        if duration <= 0:
+            return 0.0, 0.0, 0.0
+
+        return tuple((end - start) / duration
+                     for start, end in zip(startCounts, endCounts))
+
+    def format(self, now: float, gauges: Dict[str, int]) -> str:
+        # Gauges (active games, waiting players...) are given by the server
+        lines = [f'uptime_seconds {now - self.startTime:.0f}',
+                 f'connections {self.connections}']
+        lines += [f'{name} {value}' for name, value in gauges.items()]
+
+        messagesRate, bytesInRate, bytesOutRate = self.getRates()
+        lines += [f'messages_in_total {self.messagesIn}',
+                  f'bytes_in_total {self.bytesIn}',
+                  f'bytes_out_total {self.bytesOut}',
+                  f'messages_in_per_second {messagesRate:.1f}',
+                  f'bytes_in_per_second {bytesInRate:.1f}',
+                  f'bytes_out_per_second {bytesOutRate:.1f}']
+
+        for msgType, histogram in sorted(self.handling.items()):
+            lines += histogram.format(
+                'message_handling_seconds',
+                f'type="{MESSAGE_NAMES.get(msgType, msgType)}"')
+        lines += self.validation.format('move_validation_seconds')
+        lines += self.loopLag.format('event_loop_lag_seconds')
+        lines.append(f'event_loop_lag_last_second_max {self.lastLoopLag:.6f}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,91 @@
+import math
+from typing import Callable, Dict, Hashable, List, Tuple
+
+# Tick length (seconds), slots of each wheel (power of two) and number of
+# wheels: 10 ms ticks and 4 wheels of 256 slots cover about 490 days
+TICK_SIZE: float = 0.01
+SLOT_BITS: int = 8
+WHEELS_COUNT: int = 4
+
+SLOTS_COUNT: int = 1 << SLOT_BITS
+SLOT_MASK: int = SLOTS_COUNT - 1
+
+Timer = Tuple[int, Callable[[], None]]  # tick, callback
+
+
+class TimerWheel:
+    # Hierarchical timer wheel: a timer lands in the wheel matching the
+    # distance to its tick and moves to lower wheels while the time passes,
+    # so scheduling, cancelling and firing are O(1) amortised
+    def __init__(self, now: float, tickSize: float = TICK_SIZE) -> None:
+        self.tickSize: float = tickSize
+        self.currentTick: int = int(now / tickSize)
+
+        # Slots of the wheels and locations of the timers by key
+        self.wheels: List[List[Dict[Hashable, Timer]]] = [
+            [{} for _ in range(SLOTS_COUNT)] for _ in range(WHEELS_COUNT)]
+        self.locations: Dict[Hashable, Dict[Hashable, Timer]] = {}
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def schedule(self, key: Hashable, deadline: float,
+                 callback: Callable[[], None]) -> None:
+        # Timer of the same key is replaced; it never fires early
+        self.cancel(key)
+        tick = max(math.ceil(deadline / self.tickSize), self.currentTick + 1)
+        self.insert(key, (tick, callback))
+
+    def cancel(self, key: Hashable) -> None:
+        slot = self.locations.pop(key, None)
+        if slot is not None:
+            del slot[key]
+
+    def insert(self, key: Hashable, timer: Timer) -> None:
+        delta = timer[0] - self.currentTick
+        wheel = 0
+        while wheel < WHEELS_COUNT - 1 \
+                and delta >= 1 << (SLOT_BITS * (wheel + 1)):
+            wheel += 1
+
+        slot = self.wheels[wheel][(timer[0] >> (SLOT_BITS * wheel))
+                                  & SLOT_MASK]
+        slot[key] = timer
+        self.locations[key] = slot
+
+    def cascade(self, wheel: int) -> None:
+        # Timers of the current slot of a higher wheel go down
+        index = (self.currentTick >> (SLOT_BITS * wheel)) & SLOT_MASK
+        slot = self.wheels[wheel][index]
+        self.wheels[wheel][index] = {}
+
+        for key, timer in slot.items():
+            self.insert(key, timer)
+
+    def advance(self, now: float) -> None:
+        # Fire the timers of all ticks passed up to now
+        targetTick = int(now / self.tickSize)
+
+        while self.currentTick < targetTick:
+            self.currentTick += 1
+
+            # Higher wheels move down when the lower ones wrap around
+            wheel = 0
+            while wheel < WHEELS_COUNT - 1 and not (
+                    self.currentTick >> (SLOT_BITS * wheel)) & SLOT_MASK:
+                wheel += 1
+            for higherWheel in range(wheel, 0, -1):
+                self.cascade(higherWheel)
+
+            index = self.currentTick & SLOT_MASK
+            slot = self.wheels[0][index]
+            if not slot:
+                continue
+
+            # Callbacks may cancel or reschedule other timers of the slot
+            self.wheels[0][index] = {}
+            for key, (_, callback) in list(slot.items()):
+                if key in slot:
+                    del slot[key]
+                    del self.locations[key]
+                    callback()
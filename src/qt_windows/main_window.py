@@ -251,8 +251,10 @@ class MainWindow(QMainWindow):
             self.playerInputLineEdit.setReadOnly(False)
             self.playerInputLineEdit.setPlaceholderText("Input | Player №1")
 
-    def setClocks(self) -> None:
-        timeHour, timeMin, timeSec = self.startDialog.getGameTime()
+    def setClocks(self, gameTime: Optional[Tuple[int, int, int]] = None) \
+            -> None:
+        timeHour, timeMin, timeSec = gameTime \
+            or self.startDialog.getGameTime()
 
         self.clock1.setTimer(timeHour, timeMin, timeSec)
         self.clock1.startTimer()
@@ -0,0 +1,26 @@
+import sys
+import asyncio
+import argparse
+
+from net.game_server import GameServer, MAX_GAMES
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless chess server")
+    parser.add_argument("--ip", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--max-games", type=int, default=MAX_GAMES)
+    parser.add_argument("--stats-port", type=int,
+                        help="serve runtime stats on 127.0.0.1")
+    parser.add_argument("--stats-file",
+                        help="write runtime stats to the file periodically")
+    parser.add_argument("--stats-interval", type=float, default=10,
+                        help="seconds between writes of the stats file")
+    args = parser.parse_args()
+
+    server = GameServer(args.ip, args.port, args.max_games, args.stats_port,
+                        args.stats_file, args.stats_interval)
+    try:
+        asyncio.run(server.serveForever())
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,36 @@
+import pytest
+
+from logic.chess_logic import ChessLogic, START_FEN
+
+
+def testStartPosition() -> None:
+    assert ChessLogic.fromFEN(START_FEN).toFEN() == START_FEN
+
+
+@pytest.mark.parametrize('fen', [
+    '8/8/8/8/8/8/8/4K3 w - - 0 1',          # No dark king
+    '4k3/8/8/8/8/8/8/8 b - - 0 1',          # No light king
+    '4k3/8/8/8/8/8/8/3KK3 w - - 0 1',       # Two light kings
+    'k3k3/8/8/8/8/8/8/4K3 w - - 0 1',       # Two dark kings
+])
+def testKingsCount(fen: str) -> None:
+    with pytest.raises(ValueError):
+        ChessLogic.fromFEN(fen)
+
+
+@pytest.mark.parametrize('fen', [
+    'P3k3/8/8/8/8/8/8/4K3 w - - 0 1',       # Light pawn on the 8th rank
+    '4k3/8/8/8/8/8/8/p3K3 b - - 0 1',       # Dark pawn on the 1st rank
+    '4k2p/8/8/8/8/8/8/4K3 w - - 0 1',       # Dark pawn on the 8th rank
+    '4k3/8/8/8/8/8/8/4K2P w - - 0 1',       # Light pawn on the 1st rank
+])
+def testPawnsOnBackRanks(fen: str) -> None:
+    with pytest.raises(ValueError):
+        ChessLogic.fromFEN(fen)
+
+
+def testLegalPawnsAndKings() -> None:
+    # Pawns next to the back ranks are fine
+    logic = ChessLogic.fromFEN('k7/P6p/1K6/8/8/8/8/3R4 b - - 0 1')
+
+    assert len(logic.computeLegalMoves(False)) == 2
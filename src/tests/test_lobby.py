@@ -0,0 +1,63 @@
+from net.lobby import (
+    RATING_BAND_WIDTH, MAX_BAND_DISTANCE, BAND_WIDENING_INTERVAL, Lobby)
+
+BLITZ = (300000, 0)
+RAPID = (600000, 5000)
+
+
+def testSameBand() -> None:
+    lobby = Lobby()
+
+    assert lobby.join('first', BLITZ, 1510, 0.0) is None
+    assert lobby.join('second', BLITZ, 1590, 1.0) == 'first'
+    assert len(lobby) == 0
+    assert not lobby.queues
+
+
+def testAdjacentBand() -> None:
+    lobby = Lobby()
+    lobby.join('far', BLITZ, 1500 + MAX_BAND_DISTANCE * RATING_BAND_WIDTH,
+               0.0)
+    lobby.join('near', BLITZ, 1400, 1.0)
+
+    # The nearest band wins over the order of arrival
+    assert lobby.join('player', BLITZ, 1500, 2.0) == 'near'
+    assert lobby.join('other', BLITZ, 1500, 3.0) == 'far'
+
+
+def testTimeControlQueues() -> None:
+    lobby = Lobby()
+    lobby.join('blitz', BLITZ, 1500, 0.0)
+
+    assert lobby.join('rapid', RAPID, 1500, 1.0) is None
+    assert len(lobby) == 2
+    assert lobby.join('player', RAPID, 1500, 2.0) == 'rapid'
+    assert lobby.locations == {'blitz': (BLITZ, 15, 0.0)}
+
+
+def testLeave() -> None:
+    lobby = Lobby()
+    lobby.join('first', BLITZ, 1500, 0.0)
+    lobby.leave('first')
+
+    assert lobby.join('second', BLITZ, 1500, 1.0) is None
+
+
+def testLoneOutlier() -> None:
+    lobby = Lobby()
+    bandsAway = MAX_BAND_DISTANCE + 3
+    lobby.join('outlier', BLITZ, 2900, 0.0)
+
+    # Too far for a player who has just joined
+    assert lobby.join(
+        'player', BLITZ, 2900 - bandsAway * RATING_BAND_WIDTH, 1.0) is None
+    assert lobby.widen('outlier', 1.0) is None
+
+    # Allowed distance grows by one band per interval of waiting
+    now = 2 * BAND_WIDENING_INTERVAL
+    assert lobby.getWidenTime('outlier', now) == now + BAND_WIDENING_INTERVAL
+    assert lobby.widen('outlier', now) is None
+
+    now = 3 * BAND_WIDENING_INTERVAL
+    assert lobby.widen('outlier', now) == 'player'
+    assert len(lobby) == 0
@@ -0,0 +1,71 @@
+import pytest
+
+from net.protocol import (
+    HEADER, PROTOCOL_VERSION, MAX_PAYLOAD_SIZE, MAX_CLIENT_PAYLOAD_SIZE,
+    MSG_MOVE, MSG_PING, MSG_SNAPSHOT, MESSAGE_TYPES, MessageDecoder,
+    encodeMessage, encodeMove, encodeStamp, encodeSnapshot, encodePosition,
+    decodeMove, decodeSnapshot)
+
+
+def testSplitFrames() -> None:
+    # Frames cut at every byte, the header included
+    decoder = MessageDecoder()
+    data = encodeMove(0x1234) + encodeStamp(MSG_PING, 42)
+
+    messages = []
+    for ind in range(len(data)):
+        messages += decoder.feed(data[ind:ind + 1])
+
+    assert messages == [(MSG_MOVE, bytes.fromhex('1234')),
+                        (MSG_PING, bytes.fromhex('0000002a'))]
+    assert not decoder.buffer
+
+
+def testConcatenatedFrames() -> None:
+    decoder = MessageDecoder()
+    position = encodePosition('8/8/8/8/8/8/8/K6k w - - 0 1', [1, 2, 3])
+    data = encodeMove(7) + encodeSnapshot(1000, 2000, position) \
+        + encodeMessage(MSG_PING)
+
+    # The last frame is incomplete until its final byte arrives
+    messages = decoder.feed(data + encodeMove(9)[:-1])
+    assert [msgType for msgType, _ in messages] == \
+        [MSG_MOVE, MSG_SNAPSHOT, MSG_PING]
+    assert decodeMove(messages[0][1]) == 7
+    assert decodeSnapshot(messages[1][1]) == \
+        (1000, 2000, '8/8/8/8/8/8/8/K6k w - - 0 1', [1, 2, 3])
+    assert messages[2][1] == b''
+
+    assert decoder.feed(encodeMove(9)[-1:]) == [(MSG_MOVE, b'\x00\x09')]
+
+
+def testOversizedLength() -> None:
+    with pytest.raises(ValueError):
+        encodeMessage(MSG_MOVE, bytes(MAX_PAYLOAD_SIZE + 1))
+
+    # Refused from the header, before the payload is buffered
+    decoder = MessageDecoder(MAX_CLIENT_PAYLOAD_SIZE)
+    header = HEADER.pack(MAX_CLIENT_PAYLOAD_SIZE + 1, PROTOCOL_VERSION,
+                         MSG_MOVE)
+    with pytest.raises(ValueError):
+        decoder.feed(header)
+
+    # The longest payload of the default decoder
+    decoder = MessageDecoder()
+    data = encodeMessage(MSG_SNAPSHOT, bytes(MAX_PAYLOAD_SIZE))
+    assert decoder.feed(data) == [(MSG_SNAPSHOT, bytes(MAX_PAYLOAD_SIZE))]
+
+
+@pytest.mark.parametrize('msgType', [0, MESSAGE_TYPES[-1] + 1, 255])
+def testUnknownType(msgType: int) -> None:
+    decoder = MessageDecoder()
+
+    with pytest.raises(ValueError):
+        decoder.feed(encodeMove(1) + encodeMessage(msgType))
+
+
+def testUnknownVersion() -> None:
+    decoder = MessageDecoder()
+
+    with pytest.raises(ValueError):
+        decoder.feed(HEADER.pack(0, PROTOCOL_VERSION + 1, MSG_PING))
@@ -0,0 +1,91 @@
+import math
+import random
+from typing import List, Tuple
+
+import pytest
+
+from net.timer_wheel import SLOTS_COUNT, TimerWheel
+
+
+def scheduleRecorded(wheel: TimerWheel, fired: List[Tuple[str, int]],
+                     key: str, deadline: float) -> None:
+    # The tick of the wheel at the moment the timer fires is recorded
+    wheel.schedule(key, deadline,
+                   lambda: fired.append((key, wheel.currentTick)))
+
+
+@pytest.mark.parametrize('start', [0.0, 1000.3, SLOTS_COUNT - 0.5])
+def testCascade(start: float) -> None:
+    # Delays of every wheel but the last one (1-second ticks)
+    wheel = TimerWheel(start, 1.0)
+    fired = []
+    delays = [1, 3, SLOTS_COUNT - 1, SLOTS_COUNT, SLOTS_COUNT + 44,
+              SLOTS_COUNT ** 2 - 1, SLOTS_COUNT ** 2, SLOTS_COUNT ** 2 + 4.5]
+    for ind, delay in enumerate(delays):
+        scheduleRecorded(wheel, fired, str(ind), start + delay)
+
+    wheel.advance(start + SLOTS_COUNT ** 2 + 10)
+
+    assert fired == [(str(ind), math.ceil(start + delay))
+                     for ind, delay in enumerate(delays)]
+    assert len(wheel) == 0
+
+
+def testNeverEarly() -> None:
+    wheel = TimerWheel(0.0)
+    fired = []
+    scheduleRecorded(wheel, fired, 'flag', 5.0)
+
+    wheel.advance(4.99)
+    assert not fired and len(wheel) == 1
+
+    wheel.advance(5.0)
+    assert fired == [('flag', 500)]
+
+
+def testCancel() -> None:
+    wheel = TimerWheel(0.0, 1.0)
+    fired = []
+    for key, deadline in (('first', 10), ('second', 10), ('third', 1000)):
+        scheduleRecorded(wheel, fired, key, deadline)
+
+    wheel.cancel('first')
+    wheel.cancel('third')
+    wheel.cancel('unknown')
+    assert len(wheel) == 1
+
+    wheel.advance(2000)
+    assert fired == [('second', 10)]
+
+
+def testReschedule() -> None:
+    # A timer of the same key replaces the previous one
+    wheel = TimerWheel(0.0, 1.0)
+    fired = []
+    scheduleRecorded(wheel, fired, 'flag', 10)
+    scheduleRecorded(wheel, fired, 'flag', 500)
+
+    wheel.advance(1000)
+    assert fired == [('flag', 500)]
+
+
+def testCancelFromCallback() -> None:
+    wheel = TimerWheel(0.0, 1.0)
+    fired = []
+    wheel.schedule('first', 10, lambda: wheel.cancel('second'))
+    scheduleRecorded(wheel, fired, 'second', 10)
+
+    wheel.advance(20)
+    assert not fired and len(wheel) == 0
+
+
+def testDueOrder() -> None:
+    wheel = TimerWheel(0.0, 1.0)
+    fired = []
+    deadlines = random.Random(1).sample(range(1, 100000), 500)
+    for deadline in deadlines:
+        scheduleRecorded(wheel, fired, str(deadline), deadline)
+
+    wheel.advance(100000)
+    assert [tick for _, tick in fired] == sorted(deadlines)
+    assert all(key == str(tick) for key, tick in fired)